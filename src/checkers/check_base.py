@@ -9,11 +9,17 @@ class Checker:
     Attributes:
         - requirements (list): List of sub-trees in save_data needed in a checker
         - dependencies (list): List of Checkers that need to be executed before this one
+        - columnar (list): Requirements only read through their columns (see src/helpers/columnar.py), which don't need to be
+        loaded if the columns are stored
+        - definitions (list): Definition folders loaded with load_def_multiple, or [folder, depth_add] pairs. Parsed up front
+        in parallel by perform_checking (see warm_definitions)
         - output (dict): Dictionary mapping files produced by the checker mapping to lists of plottable variables. 
         Used to check if checking is necessary (whether or not these files exist) and to assign file for plotter to read
     """
     requirements = []
     dependencies = []
+    columnar = []
+    definitions = []
     output = dict()
 
     def __init__(self):
@@ -3,6 +3,7 @@ import numpy as np
 import warnings
 from src.checkers.check_base import Checker
 from src.checkers.checkers_functions import get_building_output, get_country_name, national_modifiers_manager
+from src.helpers.columnar import get_pops_columns, workforce_by_workplace, id_keys
 from src.helpers.utility import *
 
 class CheckConstruction(Checker):
@@ -11,6 +12,8 @@ class CheckConstruction(Checker):
     of player nations and nations with more construction than a minimum player's construction
     """
     requirements = ["building_manager", "country_manager", "pops"]
+    columnar = ["pops"]
+    definitions = ["production_methods", "static_modifiers"]
     output = {"construction.csv": ["construction", "avg_cost"]}
 
     def __init__(self):
@@ -26,16 +29,12 @@ class CheckConstruction(Checker):
         relevant_modifiers = ["country_construction_add"]
         buildings = save_data["building_manager"]["database"]
         countries = save_data["country_manager"]["database"]
-        pops = save_data["pops"]["database"]
+        employees = workforce_by_workplace(get_pops_columns(cache))
         
         csectors = {i: buildings[i] for i in buildings if type(buildings[i]) == dict and buildings[i]["building"] == "building_construction_sector"}
-        for pop_id, pop in pops.items():
-            if "workplace" not in pop or pop["workplace"] not in csectors:
-                continue
-            building = csectors[pop["workplace"]]
-            if "pops_employed" not in building:
-                building["pops_employed"] = dict()
-            building["pops_employed"][pop_id] = pop
+        for building_id, building_key in id_keys(csectors).items():
+            if building_id in employees:
+                csectors[building_key]["employees"] = employees[building_id]
         
         def_production_methods = load_def_multiple("production_methods", "Common Directory")
         def_static_modifiers = load_def_multiple("static_modifiers", "Common Directory")
@@ -52,7 +51,7 @@ class CheckConstruction(Checker):
             construction_list = []
             csectors_country = {i: csectors[i] for i in csectors if csectors[i]["state"] in states}
             for csector_id, csector_c in csectors_country.items():
-                if csector_c["levels"] == "0":
+                if int(csector_c["levels"]) == 0:
                     continue
                 construction_out = get_building_output(csector_c, "country_construction_add", def_production_methods)
                 if (construction_cost_term := "government_dividends") in csector_c:
@@ -99,7 +98,7 @@ class CheckConstruction(Checker):
         with pd.option_context('display.max_rows', None, 'display.max_columns', None):
             year, month, day = save_date
             df_construction.to_csv(f"{address}/data/construction.csv", sep=",", index=False)
-            df_construction = df_construction[df_construction["id"].isin(players)]
+            df_construction = df_construction[df_construction["id"].astype(str).isin(players)]
             df_construction.to_csv(f"{address}/construction.csv", sep=",", index=False)
             with open(f"{address}/construction.txt", "w", encoding="utf-8") as file:
                 file.write(f"{day}/{month}/{year}\n")
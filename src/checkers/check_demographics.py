@@ -1,13 +1,16 @@
 from src.checkers.check_base import Checker
 from src.checkers.checkers_functions import get_country_name, get_building_output, institution_manager
 from src.helpers.utility import retrieve_from_tree, load_def_multiple
+from src.helpers.columnar import get_pops_columns, type_mask, id_keys, group_sum
 import pandas as pd
+import numpy as np
 
 demographics_columns = ["literacy", "standard of living", "population", "incorporated population", "total peasants", "total unemployed", "peasants percentage", "unemployed percentage", "radicals", "loyalists", "radicals percentage", "loyalists percentage"]
 
 class CheckDemographics(Checker):
     
     requirements = ["pops", "states", "country_manager", "building_manager"]
+    columnar = ["pops", "building_manager"]
     output = {"demographics.csv":demographics_columns}
 
     def __init__(self):
@@ -20,7 +23,7 @@ class CheckDemographics(Checker):
         players = [str(p[0]) for p in cache["metadata"]["players"]]
         address = cache["address"]
 
-        pops = save_data["pops"]["database"]
+        pops = get_pops_columns(cache)
         states = save_data["states"]["database"]
         countries = save_data["country_manager"]["database"]
         # buildings = save_data["building_manager"]["database"]
@@ -48,39 +51,33 @@ class CheckDemographics(Checker):
         #         state["GBD_pollution_effect"] = pollution_effect
 
 
-        for pop_key, pop in pops.items():
-            if not isinstance(pop, dict):
-                continue
-            workers, dependents, literates, literacy, peasants, unemployed, loyalists = 0, 0, 0, 0, 0, 0, 0
-            try:
-                if "workforce" in pop:
-                    workers = int(pop["workforce"])
-                if "dependents" in pop:
-                    dependents = int(pop["dependents"])
-                total = workers + dependents
-                if "num_literate" in pop:
-                    literates = int(pop["num_literate"])
-                if pop["type"] == "peasants" and "workforce" in pop:
-                    peasants = int(pop["workforce"])
-                if "workplace" not in pop and "workforce" in pop:
-                    unemployed = int(pop["workforce"])
-                if "loyalists_and_radicals" in pop:
-                    loyalists = float(pop["loyalists_and_radicals"]) * (total) / 100
-                if "wealth" in pop:
-                    """Standard of living (SOL) = wealth + modifiers + pollution_effect + ruler personality + power_bloc modifier + state modifiers
-                    pollution_effect is workforce_scaled from all building production methods.
-                    Pollution effect is reduced by institutions and technologies.
-                    """
-                    pass
-            except KeyError:
-                print(pop)
-                raise KeyError("Missing key in pop")
-            literacy = literates / max(workers, 0.0000001) # TODO Might use this to visualize distribution of literacy
-            state = states[pop["location"]]
-            if "demographics" not in state:
-                state["demographics"] = []
-            demographics = {"population":total, "workforce":workers, "dependents":dependents, "literates":literates, "literacy":literacy, "peasants":peasants, "unemployed":unemployed, "loyalists":loyalists}
-            state["demographics"].append(demographics) # Total pop, literacy rate
+        """Standard of living (SOL) = wealth + modifiers + pollution_effect + ruler personality + power_bloc modifier + state modifiers
+        pollution_effect is workforce_scaled from all building production methods.
+        Pollution effect is reduced by institutions and technologies.
+        """
+        workers = pops["workforce"]
+        total = workers + pops["dependents"]
+        loyalists = pops["loyalists_and_radicals"] * total / 100
+        pop_demographics = { # Sum every pop column by state at once
+            "population": total,
+            "workforce": workers,
+            "dependents": pops["dependents"],
+            "literates": pops["num_literate"],
+            "peasants": np.where(type_mask(pops, "peasants"), workers, 0),
+            "unemployed": np.where(pops["workplace"] < 0, workers, 0),
+            "loyalists": np.where(loyalists > 0, loyalists, 0),
+            "radicals": np.where(loyalists < 0, -loyalists, 0),
+        }
+        state_keys = id_keys(states)
+        for key, values in pop_demographics.items():
+            locations, sums = group_sum(pops["location"], values)
+            if key not in ["loyalists", "radicals"]:
+                sums = sums.round().astype(np.int64)
+            for location, value in zip(locations.tolist(), sums.tolist()):
+                state = states[state_keys[location]]
+                if "demographics" not in state:
+                    state["demographics"] = dict()
+                state["demographics"][key] = value
         
         for key, state in states.items():
             if retrieve_from_tree(state, ["demographics"]) is None:
@@ -100,26 +97,27 @@ class CheckDemographics(Checker):
             total_population, total_workers, total_literates, total_unemployed, total_peasants, total_radicals, total_loyalists = 0, 0, 0, 0, 0, 0, 0
             incorporated_population, incorporated_workers, incorporated_literates, incorporated_unemployed, incorporated_peasants = 0, 0, 0, 0, 0
             for state in country["demographics"]:
-                incorporation, pops = state
-                total_population += sum([pop["population"] for pop in pops])
-                total_workers += sum([pop["workforce"] for pop in pops])
-                total_literates += sum([pop["literates"] for pop in pops])
-                total_unemployed += sum([pop["unemployed"] for pop in pops])
-                total_peasants += sum([pop["peasants"] for pop in pops])
-                total_loyalists += sum([pop["loyalists"] for pop in pops if pop["loyalists"] > 0])
-                total_radicals += -sum([pop["loyalists"] for pop in pops if pop["loyalists"] < 0])
+                incorporation, demographics = state
+                total_population += demographics["population"]
+                total_workers += demographics["workforce"]
+                total_literates += demographics["literates"]
+                total_unemployed += demographics["unemployed"]
+                total_peasants += demographics["peasants"]
+                total_loyalists += demographics["loyalists"]
+                total_radicals += demographics["radicals"]
                 if incorporation >= 1:
-                    incorporated_population += sum([pop["population"] for pop in pops])
-                    incorporated_workers += sum([pop["workforce"] for pop in pops])
-                    incorporated_literates += sum([pop["literates"] for pop in pops])
-                    incorporated_peasants += sum([pop["peasants"] for pop in pops])
-                    incorporated_unemployed += sum([pop["unemployed"] for pop in pops])
+                    incorporated_population += demographics["population"]
+                    incorporated_workers += demographics["workforce"]
+                    incorporated_literates += demographics["literates"]
+                    incorporated_peasants += demographics["peasants"]
+                    incorporated_unemployed += demographics["unemployed"]
             literacy = incorporated_literates / max(incorporated_workers, 0.0000001)
             peasants_percentage = total_peasants / max(total_workers, 0.0000001)
             unemployed_percentage = total_unemployed / max(total_workers, 0.0000001)
             radicals_percentage = total_radicals / max(total_population, 0.0000001)
             loyalists_percentage = total_loyalists / max(total_population, 0.0000001)
-            standard_of_living = retrieve_from_tree(country, ["avgsoltrend", "channels", "0", "values", "value"], null=[0])[-1]
+            channels = retrieve_from_tree(country, ["avgsoltrend", "channels"], null=dict())
+            standard_of_living = retrieve_from_tree(channels, ["0" if "0" in channels else 0, "values", "value"], null=[0])[-1]
             country_tag = country["definition"]
             country_name = get_country_name(country, localization)
             df_country = {
@@ -153,7 +151,7 @@ class CheckDemographics(Checker):
         with pd.option_context('display.max_rows', None, 'display.max_columns', None):
             year, month, day = save_date
             df_demographics.to_csv(f"{address}/data/demographics.csv", sep=",", index=False)
-            df_demographics = df_demographics[df_demographics["id"].isin(players)]
+            df_demographics = df_demographics[df_demographics["id"].astype(str).isin(players)]
             df_demographics.to_csv(f"{address}/demographics.csv", sep=",", index=False)
             with open(f"{address}/demographics.txt", "w") as file:
                 file.write(f"{day}/{month}/{year}\n")
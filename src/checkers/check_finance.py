@@ -1,6 +1,7 @@
 from src.checkers.check_base import Checker
 from src.checkers.checkers_functions import get_country_name
 from src.helpers.utility import retrieve_from_tree, load_def
+from src.helpers.columnar import get_buildings_columns, type_mask, id_keys, state_countries, group_sum
 import pandas as pd
 import numpy as np
 import warnings
@@ -33,6 +34,7 @@ class CheckFinance(Checker):
     requirements = ["pops", "country_manager", "building_manager", "states"]
     output = {"finance.csv":["GDP", "money", "money_percentage", "credit", "debt_percentage", "cash_reserve_limit", "ownership_levels"],}
     dependencies = ["demographics.csv"]
+    columnar = ["pops", "building_manager"]
 
     def __init__(self):
         super().__init__()
@@ -46,7 +48,7 @@ class CheckFinance(Checker):
 
         countries = save_data["country_manager"]["database"]
         states = save_data["states"]["database"]
-        buildings = save_data["building_manager"]["database"]
+        buildings = get_buildings_columns(cache)
         df_demographics = pd.read_csv(f"{address}/data/demographics.csv", sep=",")[["id", "population"]]
 
         df_finance = []
@@ -58,23 +60,16 @@ class CheckFinance(Checker):
         def_min_credit_scale = float(defines["COUNTRY_MIN_CREDIT_SCALED"])
         ownership_buildings = ["building_financial_district", "building_manor_house", "building_company"]
 
-        for building_key, building in buildings.items():
-            if not isinstance(building, dict):
-                continue
-            if "cash_reserves" in building:
-                if building["state"] not in states:
-                    continue
-                cash_reserve = building["cash_reserves"]
-                country = countries[states[building["state"]]["country"]]
-                if "data_building_reserves" not in country:
-                    country["data_building_reserves"] = 0
-                country["data_building_reserves"] += float(cash_reserve)
-                "add ownership levels to the country if the building is financial_district or company"
-                if any(building["building"] in b for b in ownership_buildings):
-                    levels = building["levels"]
-                    if "ownership_levels" not in country:
-                        country["ownership_levels"] = 0
-                    country["ownership_levels"] += int(levels)
+        state_keys = id_keys(states)
+        with_reserves = ~np.isnan(buildings["cash_reserves"]) & np.isin(buildings["state"], list(state_keys))
+        building_countries = state_countries(buildings["state"][with_reserves], states)
+        country_keys = id_keys(countries)
+        for country_id, reserves in zip(*[a.tolist() for a in group_sum(building_countries, buildings["cash_reserves"][with_reserves])]):
+            countries[country_keys[country_id]]["data_building_reserves"] = reserves
+        "add ownership levels to the country if the building is financial_district or company"
+        ownership = type_mask(buildings, lambda name: any(name in b for b in ownership_buildings), "building")[with_reserves]
+        for country_id, levels in zip(*[a.tolist() for a in group_sum(building_countries[ownership], buildings["levels"][with_reserves][ownership])]):
+            countries[country_keys[country_id]]["ownership_levels"] = int(levels)
 
         
         
@@ -131,7 +126,7 @@ class CheckFinance(Checker):
         with pd.option_context('display.max_rows', None, 'display.max_columns', None):
             year, month, day = save_date
             df_finance.to_csv(f"{address}/data/finance.csv", sep=",", index=False)
-            df_finance = df_finance[df_finance["id"].isin(players)]
+            df_finance = df_finance[df_finance["id"].astype(str).isin(players)]
             df_finance.to_csv(f"{address}/finance.csv", sep=",", index=False)
             with open(f"{address}/finance.txt", "w") as file:
                 file.write(f"{day}/{month}/{year}\n")
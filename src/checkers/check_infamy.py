@@ -39,7 +39,7 @@ class CheckInfamy(Checker):
         with pd.option_context('display.max_rows', None, 'display.max_columns', None):
             year, month, day = save_date
             df.to_csv(f"{address}/data/infamy.csv", sep=",", index=False)
-            df = df[df["id"].isin(players)]
+            df = df[df["id"].astype(str).isin(players)]
             df.to_csv(f"{address}/infamy.csv", sep=",", index=False)
             with open(f"{address}/infamy.txt", "w", encoding="utf-8") as file:
                 file.write(f"{day}/{month}/{year}\n")
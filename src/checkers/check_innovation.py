@@ -3,6 +3,7 @@ import numpy as np
 import warnings
 from src.checkers.check_base import Checker
 from src.checkers.checkers_functions import *
+from src.helpers.columnar import get_pops_columns, workforce_by_workplace, id_keys
 from src.helpers.utility import *
 
 class CheckInnovation(Checker):
@@ -12,6 +13,8 @@ class CheckInnovation(Checker):
     requirements = ["building_manager", "country_manager", "pops", "player_manager", "companies", "power_bloc_manager", "pacts", "institutions"]
     output = {"innovation.csv":["innovation", "capped_innovation", "innovation_ratio"]}
     dependencies = ["demographics.csv"]
+    columnar = ["pops"]
+    definitions = ["production_methods", "static_modifiers", "company_types", "subject_types", "power_bloc_principles"]
     
     def __init__(self):
         super().__init__()
@@ -26,16 +29,12 @@ class CheckInnovation(Checker):
 
         buildings = save_data["building_manager"]["database"]
         countries = save_data["country_manager"]["database"]
-        pops = save_data["pops"]["database"]
+        employees = workforce_by_workplace(get_pops_columns(cache))
 
         universities = {i: buildings[i] for i in buildings if type(buildings[i]) == dict and buildings[i]["building"] == "building_university"}
-        for pop_id, pop in pops.items():
-            if "workplace" not in pop or pop["workplace"] not in universities:
-                continue
-            building = universities[pop["workplace"]]
-            if "pops_employed" not in building:
-                building["pops_employed"] = dict()
-            building["pops_employed"][pop_id] = pop
+        for building_id, building_key in id_keys(universities).items():
+            if building_id in employees:
+                universities[building_key]["employees"] = employees[building_id]
 
         relevant_modifiers = ["country_weekly_innovation_add", "country_weekly_innovation_mult", "country_weekly_innovation_max_add"]
         def_production_methods = load_def_multiple("production_methods", "Common Directory")
@@ -105,7 +104,7 @@ class CheckInnovation(Checker):
         with pd.option_context('display.max_rows', None, 'display.max_columns', None):
             year, month, day = save_date
             df_innov.to_csv(f"{address}/data/innovation.csv", sep=",", index=False)
-            df_innov = df_innov[df_innov["id"].isin(players)]
+            df_innov = df_innov[df_innov["id"].astype(str).isin(players)]
             df_innov.to_csv(f"{address}/innovation.csv", sep=",", index=False)
             with open(f"{address}/innovation.txt", "w", encoding="utf-8") as file:
                 file.write(f"{day}/{month}/{year}\n")
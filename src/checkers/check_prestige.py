@@ -3,6 +3,8 @@ import os, warnings
 from src.checkers.check_base import Checker
 from src.checkers.checkers_functions import *
 from src.helpers.utility import *
+from src.helpers.columnar import get_pops_columns, get_buildings_columns, workforce_by_workplace, id_keys, state_countries
+import numpy as np
 
 """
 There are several sources of prestige, some fixed to a certain amount, some scaling by another metric. (Vickypedia)
@@ -19,6 +21,11 @@ class CheckPrestige(Checker):
                     "companies", "technology", "character_manager", "player_manager", "pacts", "pops"]
     output = {"prestige.csv": ["total_prestige"] + prestige_columns, "goods_produced.csv": ["goods_produced"]}
     dependencies = ["finance.csv"]
+    columnar = ["pops"]
+    definitions = [["defines", 1], "static_modifiers", "country_definitions", "combat_unit_types", "combat_unit_groups",
+                   "mobilization_options", "combat_unit_experience_levels", "company_types", "interest_group_traits",
+                   "character_traits", "technology/technologies", "production_methods", "production_method_groups",
+                   "buildings", "goods", "modifiers", "subject_types"]
 
     def __init__(self):
         super().__init__()
@@ -45,8 +52,6 @@ class CheckPrestige(Checker):
                             "country_prestige_from_army_power_projection_mult", "country_prestige_from_navy_power_projection_mult"]
         def_modifiers = {k:v for k, v in load_def_multiple("static_modifiers", "Common Directory").items() if any([vi in relevant_modifiers for vi in v.keys()])}
 
-        save_data = load_save(self.requirements, address)
-
         # key_veterancy = resolve_compatibility("veterancy", version)
         key_veterancy = "current_veterancy_level"
 
@@ -236,45 +241,46 @@ class CheckPrestige(Checker):
         Loop buildings for goods and monuments
         """
         # Loop through population to get monument employees
-        pops = save_data["pops"]["database"]
-        for pop_id, pop in pops.items():
-            if not isinstance(pop, dict):
-                continue
-            if "workplace" not in pop:
-                continue
-            building = buildings[pop["workplace"]]
-            if "pops_employed" not in building:
-                building["pops_employed"] = dict()
-            building["pops_employed"][pop_id] = pop
+        employees = workforce_by_workplace(get_pops_columns(cache))
+        building_keys = id_keys(buildings)
+        for building_id, workforce in employees.items():
+            buildings[building_keys[building_id]]["employees"] = workforce
             
         for building_id, building in buildings.items():
             if not isinstance(building, dict):
                 continue
-            if retrieve_from_tree(building, "dead") == "yes":
+            if retrieve_from_tree(building, "dead") in ["yes", True]:
                 continue
             country = states[building["state"]]["country"]
-            country_tag = countries[country]["definition"]
             if any([False] + [pm in def_production_methods for pm in retrieve_from_tree(building, ["production_methods", "value"], null=[])]):
                 if "monuments" not in countries[country]:
                     countries[country]["monuments"] = dict()
                 countries[country]["monuments"][building_id] = building
-            if (output_goods := retrieve_from_tree(building, ["output_goods", "goods"])) is None:
-                continue
-            for k, v in output_goods.items():
-                if country not in goods_leaderboard[k]:
-                    goods_leaderboard[k][country] = float(v["value"])
-                else:
-                    goods_leaderboard[k][country] += float(v["value"])
-                if country_tag not in df_countries_goods:
-                    df_countries_goods[country_tag] = {"id":country, "country":get_country_name(countries[country], localization)} | {num_to_goods[j]:0 for j in range(len(num_to_goods))}
-                df_countries_goods[country_tag][num_to_goods[int(k)]] += float(v["value"])
-                
+
+        # Sum the output goods of the living buildings by country and goods at once
+        building_columns = get_buildings_columns(cache)
+        goods_rows = building_columns["goods_row"]
+        alive = ~building_columns["dead"][goods_rows]
+        goods_rows, goods_index, goods_value = goods_rows[alive], building_columns["goods_index"][alive], building_columns["goods_value"][alive]
+        goods_countries = state_countries(building_columns["state"][goods_rows], states)
+        pairs, first, inverse = np.unique(goods_countries * len(num_to_goods) + goods_index, return_index=True, return_inverse=True)
+        pair_output = np.bincount(inverse, weights=goods_value, minlength=len(pairs))
+        country_keys = id_keys(countries)
+        for i in np.argsort(first, kind="stable").tolist(): # In the order of the buildings
+            country_id, k = divmod(int(pairs[i]), len(num_to_goods))
+            country = country_keys[country_id]
+            country_tag = countries[country]["definition"]
+            goods_leaderboard[str(k)][country] = float(pair_output[i])
+            if country_tag not in df_countries_goods:
+                df_countries_goods[country_tag] = {"id":country, "country":get_country_name(countries[country], localization)} | {num_to_goods[j]:0 for j in range(len(num_to_goods))}
+            df_countries_goods[country_tag][num_to_goods[k]] += float(pair_output[i])
+
 
 
         df_countries_goods = [{"tag": k} | v for k, v in df_countries_goods.items()]
         df_goods_leaderboard = pd.DataFrame(df_countries_goods, columns=["id", "tag", "country"] + [num_to_goods[int(i)] for i in range(len(num_to_goods))])
         df_goods_leaderboard.to_csv(f"{address}/data/goods_produced.csv", sep=",")
-        df_goods_leaderboard = df_goods_leaderboard[df_goods_leaderboard["id"].isin(players)]
+        df_goods_leaderboard = df_goods_leaderboard[df_goods_leaderboard["id"].astype(str).isin(players)]
         df_goods_leaderboard.to_csv(f"{address}/goods_produced.csv", sep=",")
         goods_leaderboard = {k:sorted(dictionary.items(), key=lambda item: item[1], reverse=True)[:10] for k, dictionary in goods_leaderboard.items()}
 
@@ -333,7 +339,7 @@ class CheckPrestige(Checker):
                     end_date = retrieve_from_tree(modifier, "end_date")
                     multiplier = retrieve_from_tree(modifier, "multiplier", null=1)
                     modifier = def_modifiers[modifier_name]
-                    if decay in ["yes", "linear"]:
+                    if decay in ["yes", "linear", True]:
                         # print(modifier_name)
                         decay = (1 - get_duration(save_date, start_date, end_date)[-1])
                     for mod, value in modifier.items():
@@ -433,10 +439,10 @@ class CheckPrestige(Checker):
 
                         # Veterancy
                         try:
-                            veterancy = def_veterancy[unit[key_veterancy]]
+                            veterancy = def_veterancy[str(unit[key_veterancy])]
                         except KeyError:
                             key_veterancy = "upgrades"
-                            veterancy = def_veterancy[unit[key_veterancy]]
+                            veterancy = def_veterancy[str(unit[key_veterancy])]
                         if "unit_modifier" in veterancy:
                             for vet_modifier, value in veterancy["unit_modifier"].items():
                                 if vet_modifier not in unit_modifiers:
@@ -532,7 +538,7 @@ class CheckPrestige(Checker):
         with pd.option_context('display.max_rows', None, 'display.max_columns', None):
             year, month, day = save_date
             df_prestige.to_csv(f"{address}/data/prestige.csv", sep=",", index=False)
-            df_prestige = df_prestige[df_prestige["id"].isin(players)]
+            df_prestige = df_prestige[df_prestige["id"].astype(str).isin(players)]
             df_prestige.to_csv(f"{address}/prestige.csv", sep=",", index=False)
             with open(f"{address}/prestige.txt", "w") as file:
                 file.write(f"{day}/{month}/{year}\n")
@@ -9,6 +9,7 @@ class CheckTech(Checker):
     """
 
     requirements = ["country_manager", "technology"]
+    definitions = ["technology/technologies", "technology/eras"]
     output = {"tech_tree.csv": ["production_techs", "military_techs", "society_techs", "total_techs"], "missing_techs.csv": []}
 
     def __init__(self):
@@ -92,7 +93,7 @@ class CheckTech(Checker):
             countries[country_id]["Missing tech"] = his_missing_tech
             missing_techs.update(set(his_missing_tech))
             df_tech.append({"id": country_id, "tag": country_tag, "country": country_name, "production_techs":num_prod_tech, "military_techs":num_mil_tech, "society_techs":num_soc_tech, "total_techs":len(his_tech), "tech_points":tech_points, "researching":researching_tech})
-            if researching_tech in frontier or country_id in players:
+            if researching_tech in frontier or str(country_id) in players:
                 output += f"{tech_id} {country_tag} {country_name} : {researching_tech}\n"
                 output += f"Number of tech: {len(his_tech)}, {[num_prod_tech, num_mil_tech, num_soc_tech]}\n"
                 output += "Missing tech\n"
@@ -122,7 +123,7 @@ class CheckTech(Checker):
                 continue
             df_missing_tech.update({tech:True for tech in missing_tech})
             df_missing_techs.append(df_missing_tech)
-            if country_id in players:
+            if str(country_id) in players:
                 df_missing_techs_players.append(df_missing_tech)
         
         df_missing_techs = pd.DataFrame(df_missing_techs, columns=["id", "tag", "country"] + missing_techs_keys)
@@ -153,7 +154,7 @@ class CheckTech(Checker):
         df_tech.sort_values(by=["total_techs"], inplace=True, ascending=False)
         with pd.option_context('display.max_rows', None, 'display.max_columns', None):
             df_tech.to_csv(f"{address}/data/tech_tree.csv", sep=",", index=False, encoding="utf-8")
-            df_tech = df_tech[df_tech["id"].isin(players)]
+            df_tech = df_tech[df_tech["id"].astype(str).isin(players)]
             df_tech.to_csv(f"{address}/tech_tree.csv", sep=",", index=False, encoding="utf-8")
             df_missing_techs.to_csv(f"{address}/data/missing_techs.csv", sep=",", encoding="utf-8")
             df_missing_techs_players.to_csv(f"{address}/missing_techs.csv", sep=",", encoding="utf-8")
@@ -31,8 +31,13 @@ def companies_manager(save_data, countries, relevant_modifiers):
 def subject_manager(save_data, countries):
     """
     Get all subjects of each country and the country it is subject to
+    They are listed again on every call, since the checkers share the countries of the loaded save
     """
     def_subjects = [v["diplomatic_action"] for v in load_def_multiple("subject_types", "Common Directory").values()]
+    for country in countries.values():
+        if isinstance(country, dict):
+            country.pop("subjects", None)
+            country.pop("subject_to", None)
     for _, pact in save_data["pacts"]["database"].items():
         if not isinstance(pact, dict):
             continue
@@ -111,7 +116,7 @@ def national_modifiers_manager(country, save_date, def_modifiers, relevant_modif
         end_date = retrieve_from_tree(modifier, "end_date")
         multiplier = retrieve_from_tree(modifier, "multiplier", null=1)
         modifier = def_modifiers[modifier_name]
-        if decay == "yes" or decay == "linear":
+        if decay in ["yes", "linear", True]:
             decay = (1 - get_duration(save_date, start_date, end_date)[-1])
         for mod, value in modifier.items():
             if mod in relevant_modifiers:
@@ -142,14 +147,16 @@ def get_save_date(address, split=True):
     metadata = load_save(["meta_data"], address)
     save_date = metadata["meta_data"]["game_date"]
     if split:
-        year, month, day = save_date.split(".")[:3]
+        year, month, day = split_date(save_date)
         return year, month, day
+    if not isinstance(save_date, str): # Typed extraction
+        save_date = ".".join([str(i) for i in save_date])
     return save_date
 
 def get_building_output(building, target, def_production_methods, modifier_type="country_modifiers"):
     """
     Calculate a building's output of a variable with respected to production methods, employees and throughput
-    Employees must be added into a building from the outside in building["pops_employed"]
+    The workforce employed must be added into a building from the outside in building["employees"] (see workforce_by_workplace)
     """
     output = 0
     employees = 0
@@ -165,9 +172,8 @@ def get_building_output(building, target, def_production_methods, modifier_type=
                 else:
                     employees_pl[key] += int(addition)
 
-    if "pops_employed" in building:
-        for key, pop in building["pops_employed"].items():
-            employees += int(pop["workforce"] )
+    if "employees" in building:
+        employees = building["employees"]
 
     # print(employees_pl)
     # print(f"Total Employees at level {int(building['level'])}: {employees}")
@@ -9,6 +9,7 @@ from src.checkers.check_finance import CheckFinance, finance_columns
 
 from src.helpers.plotter import plot_stat, plot_goods_produced
 from src.helpers.convert_localization import get_all_localization
+from src.helpers.columnar import columnar_requirements
 import os, glob
 
 class SaveManager:
@@ -19,18 +20,23 @@ class SaveManager:
     Checkers will no longer load data on their own.
     """
 
-    def __init__(self, address, checks=None):
-        self.cache = {"address": address, "localization":get_all_localization()}
-        self.cache["address"] = address
+    def __init__(self, address, checks=None, localization=None):
+        """
+        localization (dict, optional): Localization shared by every save. Default is None (see get_all_localization)
+        """
+        self.localization = get_all_localization() if localization is None else localization
+        self.cache = {"address": address, "localization":self.localization}
         self.checks = checks
-        self.localization = get_all_localization()
         os.makedirs(f"{address}/data", exist_ok=True)  # Create a data folder for outputs
         requirements = self.check_metadata(False) # mandatory to obtain metadata
+        tree_requirements = set(requirements) # Requirements read as data trees by at least one checker
         for check in checks: # Combine all needed requirements
             if not check.check_needs(address, False): # TODO deal with resetting later
                 continue
             requirements.update(check.requirements)
-        self.save_data = load_save(list(requirements), address)
+            tree_requirements.update([topic for topic in check.requirements if topic not in check.columnar])
+        columnar = [topic for topic in requirements if topic not in tree_requirements]
+        self.save_data = load_save(columnar_requirements(list(requirements), address, columnar), address, lazy=True) # Stored columns replace their topics
         self.metadata = self.get_metadata(address)
         self.cache = {"save_data":self.save_data, "metadata":self.metadata, "localization":self.localization, "address":address}
 
@@ -39,12 +45,24 @@ class SaveManager:
     def start_checking(self):
         while self.checks:
             remaining_checks = []
-            for check in self.checks:
+            for i, check in enumerate(self.checks):
+                if check.check_needs(self.cache["address"], False):
+                    self.save_data.load(check.requirements) # Read its sections concurrently rather than one by one on access
                 done = check.check(self.cache)
                 if not done: # Due to dependencies
                     remaining_checks.append(check)
+                else:
+                    self.release_sections(remaining_checks + self.checks[i + 1:])
             self.checks = remaining_checks
 
+    def release_sections(self, checks):
+        """Release the loaded sections of the save that none of the given checks still needs"""
+        needed = set()
+        for check in checks:
+            if check.check_needs(self.cache["address"], False):
+                needed.update(check.requirements)
+        self.save_data.release([topic for topic in self.save_data if topic not in needed])
+
     def check_metadata(self, reset=False):
         """Check if loading metadata from the save file is necessary. Returns the requirement set"""
         requirements = set(["meta_data", "player_manager", "country_manager"])
@@ -61,14 +79,14 @@ class SaveManager:
         if "metadata.json" not in os.listdir(address):
             data = self.save_data
             metadata["version"] = data["meta_data"]["version"]
-            metadata["save_date"] = data["meta_data"]["game_date"].split(".")[:3]
+            metadata["save_date"] = split_date(data["meta_data"]["game_date"])
             players = data["player_manager"]["database"]
             countries = data["country_manager"]["database"]
             player_data = []
             countries_id = []
             for _, player in players.items():
                 player_id = player["country"]
-                if not isinstance(retrieve_from_tree(countries, player_id), dict):
+                if not isinstance(retrieve_from_tree(countries, [player_id]), dict):
                     continue
                 if player_id in countries_id:
                     continue
@@ -100,13 +118,19 @@ def perform_checking(checks, shows, campaign_folder, stop_event, finish_event):
                 check_map[outvar] = (checker_class, output)
     try:
         checkers = [c() for c in list(set([check_map[check][0] for check in checks]))] # Instantiate a single object from each class
+        definitions = [["country_definitions", 0], ["named_colors", 1], ["goods", 0]] # Used by the plotter
+        for checker in checkers:
+            definitions += [[d, 0] if isinstance(d, str) else list(d) for d in checker.definitions]
+        warm_definitions([d for i, d in enumerate(definitions) if d not in definitions[:i]])
+        localization = get_all_localization()
         for folder in glob.glob(os.path.join("saves", campaign_folder, "*")):
             if stop_event.is_set():
                 raise InterruptedError("Stop event set")
             if is_reserved_folder(folder):
                 continue
-            save = SaveManager(folder, checkers)
+            save = SaveManager(folder, checkers, localization)
             save.start_checking()
+        print(f"Definitions registry: {get_definitions_stats()}")
         """
         Make exceptional cases for prestige (many subcategories) and goods_produced (many goods)
         """
@@ -1,11 +1,206 @@
 """
 Save files extraction logic.
 """
-import re, gzip, pickle, os, json
+import re, os, json, codecs, io, hashlib, concurrent.futures
+from src.helpers.storage import write_manifest, write_sections, SectionWriter
 
 with open("./src/variables.json", "r") as file:
     VARIABLES = json.load(file)
 
+CHUNK_SIZE = 1 << 20 # Characters read from a save at a time
+
+def read_segments(stream, chunk_size=CHUNK_SIZE):
+    """
+    Read a text stream chunk by chunk and yield the segments of text between curly brackets as well as the brackets themselves.
+
+    Whitespaces inside each segment are collapsed into single spaces and whitespace-only segments are dropped, which gives
+    the same output as normalizing and splitting the whole text at once while holding only a chunk of it at a time.
+
+    Parameters:
+    stream: Text stream of the file, anything with read(size)
+    chunk_size (int, optional): Number of characters read at a time. None reads the whole stream at once.
+    """
+    spacing_ex = re.compile(r"\s+")
+    bracket_ex = re.compile(r"\s?([{}])\s?")
+    remainder = ""
+    while chunk := stream.read(-1 if chunk_size is None else chunk_size):
+        parts = bracket_ex.split(spacing_ex.sub(" ", remainder + chunk))
+        remainder = parts.pop() # The last part may continue in the next chunk
+        for part in parts:
+            if part.strip():
+                yield part
+    if remainder.strip():
+        yield remainder
+
+class BufferReader:
+    """
+    Binary file over a melted save in memory (see melt_buffer). Unlike io.BytesIO, it never copies the whole buffer.
+    """
+    def __init__(self, buffer):
+        self.buffer = memoryview(buffer)
+        self.position = 0
+
+    def seek(self, position):
+        self.position = position
+
+    def read(self, size=-1):
+        end = len(self.buffer) if size is None or size < 0 else min(self.position + size, len(self.buffer))
+        data = self.buffer[self.position:end].tobytes()
+        self.position = max(self.position, end)
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.buffer.release()
+
+def open_binary(address):
+    """Open a melted save file, or a melted save in memory (see melt_buffer), in binary mode"""
+    return BufferReader(address) if isinstance(address, (bytes, bytearray)) else open(address, "rb")
+
+def index_save(address, chunk_size=CHUNK_SIZE):
+    """
+    Map every root section of a melted save (file path or bytes) to the byte offsets [start, end) of its text, from the
+    start of its key to the end of its closing bracket. Brackets are counted in a single pass without building any tree.
+    Anonymous root sections (without a key) aren't indexed. A repeated key keeps its last section like the parser does.
+    """
+    bracket_ex = re.compile(rb"[{}]")
+    key_ex = re.compile(rb"([^\s={}]+)\s*=\s*(?:rgb|hsv360|hsv)?\s*$")
+    sections = dict()
+    depth = 0
+    offset = 0 # Offset of the current chunk in the file
+    root_text = b"" # Text at the root level since the last root section
+    key, start = None, 0
+    with open_binary(address) as file:
+        while chunk := file.read(chunk_size):
+            last = 0
+            for match in bracket_ex.finditer(chunk):
+                position = match.start()
+                if match.group() == b"{":
+                    if depth == 0:
+                        root_text += chunk[last:position]
+                        if key_match := key_ex.search(root_text):
+                            key = key_match.group(1).decode("utf-8-sig")
+                            start = offset + position - (len(root_text) - key_match.start())
+                        else:
+                            key = None
+                        root_text = b""
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        if key is not None:
+                            sections[key] = [start, offset + position + 1]
+                        last = position + 1
+            if depth == 0:
+                root_text += chunk[last:]
+            offset += len(chunk)
+    return sections
+
+def hash_sections(address, index, chunk_size=CHUNK_SIZE):
+    """
+    Hash the raw text of every indexed root section of a melted save (file path or bytes), to tell which sections are
+    unchanged since another save. Returns a dictionary of section to hexadecimal digest.
+    """
+    hashes = dict()
+    with open_binary(address) as file:
+        for section, (start, end) in sorted(index.items(), key=lambda item: item[1][0]):
+            file.seek(start)
+            digest = hashlib.blake2b(digest_size=16)
+            while start < end:
+                digest.update(chunk := file.read(min(chunk_size, end - start)))
+                start += len(chunk)
+            hashes[section] = digest.hexdigest()
+    return hashes
+
+def ranges_around(index, sections, size):
+    """
+    Byte ranges [start, end) of a melted save of the given size around some of its indexed root sections
+    """
+    ranges, position = [], 0
+    for start, end in sorted([index[section] for section in sections]):
+        ranges.append([position, start])
+        position = end
+    ranges.append([position, size])
+    return ranges
+
+def get_index_address(address):
+    """Address of the root section index of a melted save, i.e. save.txt -> save_index.json"""
+    return f"{os.path.splitext(address)[0]}_index.json"
+
+def write_index(address):
+    """
+    Index the root sections of a melted save (see index_save) and write it alongside the save.
+    The size and modification time of the save are recorded so that a stale index is ignored.
+    """
+    index = {"size": os.path.getsize(address), "mtime": os.path.getmtime(address), "sections": index_save(address)}
+    with open(get_index_address(address), "w") as file:
+        json.dump(index, file)
+    return index["sections"]
+
+def read_index(address):
+    """
+    Read the root section index of a melted save. Returns None if there is none or if the save has changed since.
+    """
+    try:
+        with open(get_index_address(address), "r") as file:
+            index = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if index["size"] != os.path.getsize(address) or index["mtime"] != os.path.getmtime(address):
+        return None
+    return index["sections"]
+
+class SectionReader:
+    """
+    Text stream over the bytes [start, end) of a file opened in binary mode, e.g. one root section of a melted save.
+    """
+    def __init__(self, file, start, end):
+        file.seek(start)
+        self.file = file
+        self.remaining = end - start
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return self.decoder.decode(data, final=self.remaining == 0)
+
+DATE_EX = re.compile(r"\d+\.\d+\.\d+(\.\d+)?$")
+
+def typed_value(value):
+    """
+    Convert a leaf of a melted save into the type of its literal: int, float, True/False for yes/no and a tuple of
+    ints for dates (Y.M.D or Y.M.D.H). Anything else (including quoted values) is returned unchanged.
+    """
+    if value == "yes":
+        return True
+    if value == "no":
+        return False
+    if value[0].isdigit() or value[0] == "-":
+        try:
+            return int(value)
+        except ValueError:
+            pass
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        if DATE_EX.match(value):
+            return tuple([int(i) for i in value.split(".")])
+    return value
+
+def leaf_value(value, typed=False):
+    """
+    Strip the quotation marks from a leaf while it is parsed, or convert an unquoted leaf if typed (see typed_value).
+    """
+    if '"' in value:
+        return value.replace('"', "")
+    return typed_value(value) if typed else value
+
 class Extractor:
     """
     A class dedicated to parsing Victoria 3's common and saves from plain text to a JSON-parsable Python dictionary.
@@ -27,8 +222,8 @@ class Extractor:
     address (str): The file path of the text file to be parsed.
     is_save (bool, optional): Specify whether this is a save file or not which may reduce time by omitting operations required
                             in extracting definition files (like removing comments)
-    focuses (str, optional): A specific section of the file to focus on, if any. If specified, parsing will 
-                           only occur within the scope where this substring is found at the root level. Default is None.
+    focuses (list, optional): Root sections of the file to focus on, if any. If specified, every other section at the
+                           root level is skipped by counting its brackets without being parsed. Default is None (Parse all).
     pline (bool, optional): If True, print each line of the file as it's processed. This is useful for debugging. 
                             Default is False.
     version (string, optional): Version of the game of this file.
@@ -37,24 +232,58 @@ class Extractor:
     data (dict): The structured data extracted from the file, organized as a nested dictionary.
     
     Methods:
-    write(output, sections=None, separate=False): Write the data tree into a zipped pickle.
+    write(output, sections=None, separate=False, codec=None, threads=None): Write the data tree into compressed pickles.
+    start_writing(output, codec=None, threads=None): Write the root sections in the background as soon as they're parsed.
 
     Examples:
-    extractor = Extractor("path/to/victoria3_data.txt", is_save=True, focus="population", pline=True)
-    extractor.unquote()
-    extractor.write("saves/campaign/save", ["population"])
+    extractor = ExtractorSave("path/to/victoria3_data.txt", focuses=["pops"], pline=True)
+    extractor.write("saves/campaign/save", ["pops"])
     """
     def __init__(self) -> None:
         self.data = dict()
+        self.typed = False
+        self.writer = None # See start_writing
+        self.written = dict() # Root sections submitted to the writer
+
+    def start_writing(self, output, codec=None, threads=None):
+        """
+        Write the root sections into a save folder in the background as soon as they're complete (see SectionWriter), so that
+        their pickling and compression overlap with the parsing of the next ones. write(output, separate=True) then writes
+        the rest and waits for them.
+        codec: Codec of the written files. Default is None (storage_codec of variables.json)
+        threads: Number of writing threads. Default is None (write_threads of variables.json)
+        """
+        os.makedirs(f"{output}/extracted_save", exist_ok=True)
+        self.writer = SectionWriter(output, VARIABLES["storage_codec"] if codec is None else codec, VARIABLES["sharded_topics"],
+                                    VARIABLES["shard_size"], VARIABLES["deduplicated_topics"], VARIABLES["block_size"],
+                                    VARIABLES["write_threads"] if threads is None else threads)
+        self.written = dict()
 
-    def write(self, output, sections=None, separate=False):
+    def section_complete(self, key):
+        """
+        Hand a complete root section over to the writer, if writing in the background
         """
-        Write the data tree into a zipped pickle.
+        if self.writer is not None and isinstance(self.data.get(key), dict):
+            self.written[key] = self.data[key]
+            self.writer.submit(key, {key: self.data[key]})
+
+    def write(self, output, sections=None, separate=False, codec=None, threads=None):
+        """
+        Write the data tree into compressed pickles (see src/helpers/storage.py), one per root section so that each can be
+        loaded on its own.
 
         Arguments:
         output: Folder address
-        sections: List of subtrees to be written. Default is None (Write all)
+        sections: List of subtrees to be written. Default is None (Write all). Other sections already stored are kept
         separate: Whether or not the data should be written in one file. Default is False
+        codec: Codec of the written files, i.e. "zlib-1" or "lzma". Default is None (storage_codec of variables.json)
+        threads: Number of writing threads. Default is None (write_threads of variables.json)
+
+        The databases of sharded_topics of variables.json are split into shards of shard_size entries, and the entries of
+        deduplicated_topics are stored once per campaign.
+        Whether the tree is typed (see ExtractorSave), the codec of each file and the shards are recorded in extracted_save/manifest.json.
+        If writing in the background (see start_writing) into the same folder with the same codec, only the sections which
+        weren't written yet are written.
         """ 
         if sections is not None:
             data_output = {k : v for k, v in self.data.items() if k in sections}
@@ -66,21 +295,28 @@ class Extractor:
             os.mkdir(f"{output}/extracted_save")
         except FileExistsError:
             pass
-        miscellaneous = dict()
-        for k, v in data_output.items():
-            if k not in VARIABLES["large_topics"]:
-                miscellaneous[k] = v
-                continue
-            with gzip.open(f"{output}/extracted_save/{k}.gz", 'wb') as f:
-                pickle.dump({k : v}, f, protocol=pickle.HIGHEST_PROTOCOL)
-        with gzip.open(f"{output}/extracted_save/miscellaneous.gz", 'wb') as f:
-            pickle.dump(miscellaneous, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if codec is None:
+            codec = VARIABLES["storage_codec"]
+        writer, self.writer = self.writer, None
+        if writer is not None and separate and writer.output == output and writer.codec == codec:
+            for k, v in data_output.items():
+                if self.written.get(k) is not v: # Not complete while parsing, i.e. root values, or replaced since
+                    writer.submit(k, {k : v})
+            writer.close()
+        else:
+            if writer is not None:
+                writer.close()
+            write_sections(output, {k : {k : v} for k, v in data_output.items()}, codec, VARIABLES["sharded_topics"], VARIABLES["shard_size"],
+                           VARIABLES["deduplicated_topics"], VARIABLES["block_size"],
+                           VARIABLES["write_threads"] if threads is None else threads)
+        write_manifest(output, {"typed": self.typed})
 
 
     
     def unquote(self, scope=None):
         """
         Recursively removes quotation marks from all string values within the provided scope of the data dictionary.
+        The parsers already strip them from every leaf they create, so this is only needed for trees built otherwise.
 
         This method navigates through the dictionary (or a sub-dictionary) to clean up string entries by removing any 
         embedded double quotes. It processes dictionaries, lists within dictionaries, and string values recursively. 
@@ -114,48 +350,167 @@ class ExtractorSave(Extractor):
     Victoria 3 save files, including specific parsing rules and data extraction methods.
     
     It utilizes the same methods as Extractor but is optimized for save file formats.
+
+    The save is consumed in chunks of chunk_size characters (see read_segments) so that the peak memory scales with
+    the resulting tree rather than with copies of the whole text.
+    If focuses are given and the save has an up-to-date root section index (see write_index), only the text of the
+    focused sections is read. Root values outside of any section are then left out.
+
+    Parameters:
+    address (str, bytes or text stream): The file path of the melted save, the melted save itself (see melt_buffer)
+                                         or an opened text stream (anything with read(size))
+    chunk_size (int, optional): Number of characters read from the save at a time. None reads the whole save at once.
+    processes (int, optional): Number of worker processes parsing the large root sections of a save file path in parallel
+                               (see parse_parallel). Default is 1 (Parse in this process only)
+    typed (bool, optional): Convert numbers, yes/no and dates into int, float, bool and tuple while parsing (see typed_value)
+                            and numeric keys, i.e. ids, into int so that they keep matching the values referring to them.
+                            Default is False (Keep every leaf as a string)
+    interning (bool, optional): Share a single string object between equal keys and between equal word-like values
+                                (pop types, building types, yes/no...) so that the tree, and its pickles through pickle's memo,
+                                hold each of them once. Default is True
+    skip (list, optional): Root sections not to be parsed, i.e. already extracted. Without focuses, the text around them is
+                           read with the given index (see index_save). Default is None (Skip nothing)
+    index (dict, optional): Root section index of the save (see index_save), needed to read only the focused sections of a
+                            save in memory or to skip some. Default is None (Read the save's index file if any)
+    output (str, optional): Save folder into which the root sections are written in the background as soon as they're parsed
+                            (see start_writing), to be completed by write(output, separate=True, codec=codec). Default is None
+    codec (str, optional): Codec of the files written in the background. Default is None (storage_codec of variables.json)
+    write_threads (int, optional): Number of threads writing in the background. Default is None (write_threads of variables.json)
     """
-    def __init__(self, address, focuses=None, pline=False, version="1.9"):
+    def __init__(self, address, focuses=None, pline=False, version="1.9", chunk_size=CHUNK_SIZE, processes=1, typed=False, interning=True,
+                 skip=None, index=None, output=None, codec=None, write_threads=None):
         super().__init__()
+        self.typed = typed
+        self.strings = dict() if interning else None # Interned strings of the tree
+        if output is not None:
+            self.start_writing(output, codec, write_threads)
+        try:
+            self.read(address, focuses, pline, chunk_size, processes, skip, index)
+        except BaseException:
+            if self.writer is not None:
+                self.writer.abort()
+                self.writer = None
+            raise
+
+    def read(self, address, focuses=None, pline=False, chunk_size=CHUNK_SIZE, processes=1, skip=None, index=None):
+        """
+        Parse the save with the fastest way available for the given arguments (see ExtractorSave)
+        """
+        if isinstance(focuses, str):
+            focuses = [focuses]
+        if skip and focuses is not None:
+            focuses = [focus for focus in focuses if focus not in skip]
+        if index is None and isinstance(address, str) and processes == 1 and (skip or focuses is not None):
+            index = read_index(address)
+        indexed = index is not None and isinstance(address, (str, bytes, bytearray)) and processes == 1
+        if indexed and focuses is not None and all([focus in index for focus in focuses]):
+            self.parse_ranges(address, [index[focus] for focus in focuses], pline, chunk_size)
+        elif indexed and skip and focuses is None:
+            size = len(address) if isinstance(address, (bytes, bytearray)) else os.path.getsize(address)
+            self.parse_ranges(address, ranges_around(index, [section for section in skip if section in index], size), pline, chunk_size)
+        elif isinstance(address, (bytes, bytearray)): # Melted in memory
+            self.parse(SectionReader(BufferReader(address), 0, len(address)), focuses, pline, chunk_size)
+        elif not isinstance(address, str):
+            self.parse(address, focuses, pline, chunk_size)
+        elif processes > 1:
+            self.parse_parallel(address, focuses, pline, chunk_size, processes, skip)
+        else:
+            with open(address, "r", encoding='utf-8-sig') as file:
+                self.parse(file, focuses, pline, chunk_size)
+
+    def parse_ranges(self, address, ranges, pline=False, chunk_size=CHUNK_SIZE):
+        """
+        Parse the byte ranges [start, end) of a melted save (file path or bytes), each of them starting at the root level.
+        """
+        with open_binary(address) as file:
+            for start, end in ranges:
+                self.parse(SectionReader(file, start, end), None, pline, chunk_size)
+
+    def parse_parallel(self, address, focuses=None, pline=False, chunk_size=CHUNK_SIZE, processes=2, skip=None):
+        """
+        Parse the large root sections listed in "parallel_topics" of variables.json in worker processes (at most processes of them)
+        while the rest of the save is parsed in this process, then merge them into the same data tree.
+        The root sections are located with the save's index, which is written first if there is none.
+        Without focuses, the sections to skip are left out as well.
+        """
+        if (index := read_index(address)) is None:
+            index = write_index(address)
+        skip = [section for section in skip or [] if section in index]
+        parallel_topics = [topic for topic in VARIABLES["parallel_topics"] if topic in index and (focuses is None or topic in focuses) and topic not in skip]
+        if focuses is None: # Everything around the parallel sections, including root values outside of any section
+            ranges = ranges_around(index, parallel_topics + skip, os.path.getsize(address))
+        elif all([focus in index for focus in focuses]):
+            ranges = [index[focus] for focus in focuses if focus not in parallel_topics]
+        else: # Some focuses aren't sections, read the whole save for them
+            ranges = None
+        with concurrent.futures.ProcessPoolExecutor(max(1, min(processes, len(parallel_topics)))) as pool:
+            futures = [pool.submit(parse_root_section, address, topic, chunk_size, self.typed, self.strings is not None) for topic in parallel_topics]
+            if ranges is None:
+                with open(address, "r", encoding='utf-8-sig') as file:
+                    self.parse(file, [focus for focus in focuses if focus not in parallel_topics], pline, chunk_size)
+            else:
+                self.parse_ranges(address, ranges, pline, chunk_size)
+            for future in futures:
+                self.data.update(section := future.result())
+                for key in section:
+                    self.section_complete(key)
+
+    def parse(self, stream, focuses=None, pline=False, chunk_size=CHUNK_SIZE):
+        """
+        Build the data tree from a text stream of a melted save.
+        """
+        typed = self.typed
+        strings = self.strings
+        writing = self.writer is not None
         scope = [self.data]
         current_key = None
+        root_key = None # Root section being parsed
         scope_boolean = False
-        in_focus = False
+        skipped_depth = 0 # Depth inside a root section outside of focuses
+        if isinstance(focuses, str):
+            focuses = [focuses]
 
-        spacing_ex_save = re.compile(r"(\s+)")
         split_ex = re.compile(r'(?<!=)\s(?!=)')
         catch_ex = re.compile(r"^\s?([^=]*)\s?(=)?\s?(rgb|hsv360|hsv)?\s?(\S+)?") # Include less conditions for potentially faster computation
-        
-        with open(address, "r", encoding='utf-8-sig') as file:
-            text = file.read()
-        text = spacing_ex_save.sub(" ", text)
-        file.close()
-        
-        for sstr in re.split(r"\s?([{}])\s?", text):
-            if not sstr.strip():
+
+        for sstr in read_segments(stream, chunk_size):
+            if skipped_depth: # Only count brackets until the unfocused section ends
+                if sstr == "{":
+                    skipped_depth += 1
+                elif sstr == "}":
+                    skipped_depth -= 1
                 continue
             if pline:
                 print(repr(sstr))
             last_scope = scope[-1]
-            if "{" in sstr:
+            if sstr == "{":
                 if current_key is None: # Double opening brackets
                     current_key = f"index{len(last_scope)}"
                     last_scope[current_key] = dict()
-                scope.append(last_scope[current_key])
+                if focuses is not None and len(scope) == 1 and current_key not in focuses:
+                    del last_scope[current_key]
+                    skipped_depth = 1
+                else:
+                    if len(scope) == 1:
+                        root_key = current_key
+                    scope.append(last_scope[current_key])
                 current_key = None
-            elif '}' in sstr:
+            elif sstr == "}":
                 scope = scope[:-1]
                 if len(scope) == scope_boolean: # End of a Boolean Check
                     scope_boolean = False
-                if len(scope) == 0 and focuses is not None and in_focus:
-                    if focuses == []:
-                        break
-                    else:
-                        in_focus = False
+                if writing and len(scope) == 1:
+                    self.section_complete(root_key)
             elif all([i not in sstr for i in [">", "=", "<"]]): # Simple list of values
                 if "field_type" not in last_scope:
                     last_scope.update({"field_type":"list"})
-                last_scope.update({"value":[field for field in split_ex.split(sstr) if len(field) > 0]})
+                if typed:
+                    values = [leaf_value(field, True) for field in split_ex.split(sstr) if len(field) > 0]
+                else:
+                    values = [field.replace('"', "") for field in split_ex.split(sstr) if len(field) > 0]
+                if strings is not None:
+                    values = [strings.setdefault(v, v) if v.__class__ is str and v[:1].isalpha() else v for v in values]
+                last_scope.update({"value":values})
             else: # Dictionary type fields with equations
                 parts = split_ex.split(sstr) # Split by whitespaces not adjacent to the (in)equality sign
                 for field in parts:
@@ -164,7 +519,17 @@ class ExtractorSave(Extractor):
                     if match := catch_ex.match(field):
                         key, equality, color, value = match.groups()
                         boolean = None
-                        if value is not None: 
+                        if typed and key.isdigit():
+                            key = int(key)
+                        elif strings is not None:
+                            key = strings.setdefault(key, key)
+                        if value is not None:
+                            if '"' in value: # Strip quotation marks while parsing instead of walking the tree afterwards
+                                value = value.replace('"', "")
+                            elif typed:
+                                value = typed_value(value)
+                            if strings is not None and value.__class__ is str and value[:1].isalpha(): # Word-like values repeat
+                                value = strings.setdefault(value, value)
                             if boolean is None: # Simple Equality match
                                 if scope_boolean:
                                     last_scope[key] = {"sign": "=", "value":value}
@@ -179,7 +544,7 @@ class ExtractorSave(Extractor):
                             if color is None:
                                 if boolean is None:
                                     if equality is None: # Lone entries without key is assigned a default key
-                                        last_scope[f"index{len(last_scope)}"] = field
+                                        last_scope[f"index{len(last_scope)}"] = leaf_value(field, typed)
                                     else: # Incomplete equality match
                                         last_scope[key] = {}
                                         current_key = key
@@ -196,6 +561,12 @@ class ExtractorSave(Extractor):
                     else:
                         raise NotImplementedError(f"Exceptional field: {field}")
 
+def parse_root_section(address, key, chunk_size=CHUNK_SIZE, typed=False, interning=True):
+    """
+    Parse a single root section of an indexed melted save. Used by the worker processes of ExtractorSave.parse_parallel.
+    """
+    return ExtractorSave(address, focuses=[key], chunk_size=chunk_size, typed=typed, interning=interning).data
+
 
 class ExtractorCommon(Extractor):
     """
@@ -211,7 +582,9 @@ class ExtractorCommon(Extractor):
         scope = [self.data]
         current_key = None
         scope_boolean = False
-        in_focus = False
+        skipped_depth = 0 # Depth inside a root section outside of focuses
+        if isinstance(focuses, str):
+            focuses = [focuses]
         spacing_ex = re.compile(r"(#+.*\n|\s+|#+.*$)")
         split_ex = re.compile(r'(?<!<|>|=)\s(?!<|>|=|\?)')
         catch_ex = re.compile(r"^([^=><\?\s]*)\s?([><\?])?(=)?\s?(rgb|hsv360|hsv)?\s?(\S+)?$")
@@ -235,6 +608,12 @@ class ExtractorCommon(Extractor):
         for sstr in re.split(r"\s?([{}])\s?", text):
             if not sstr.strip():
                 continue
+            if skipped_depth: # Only count brackets until the unfocused section ends
+                if "{" in sstr:
+                    skipped_depth += 1
+                elif '}' in sstr:
+                    skipped_depth -= 1
+                continue
             if pline:
                 print(repr(sstr))
             last_scope = scope[-1]
@@ -242,21 +621,20 @@ class ExtractorCommon(Extractor):
                 if current_key is None: # Double opening brackets
                     current_key = f"index{len(last_scope)}"
                     last_scope[current_key] = dict()
-                scope.append(last_scope[current_key])
+                if focuses is not None and len(scope) == 1 and current_key not in focuses:
+                    del last_scope[current_key]
+                    skipped_depth = 1
+                else:
+                    scope.append(last_scope[current_key])
                 current_key = None
             elif '}' in sstr:
                 scope = scope[:-1]
                 if len(scope) == scope_boolean: # End of a Boolean Check
                     scope_boolean = False
-                if len(scope) == 0 and focuses is not None and in_focus:
-                    if focuses == []:
-                        break
-                    else:
-                        in_focus = False
             elif all([i not in sstr for i in [">", "=", "<"]]): # Simple list of values
                 if "field_type" not in last_scope:
                     last_scope.update({"field_type":"list"})
-                last_scope.update({"value":[field for field in split_ex.split(sstr) if len(field) > 0]})
+                last_scope.update({"value":[field.replace('"', "") for field in split_ex.split(sstr) if len(field) > 0]})
             else: # Dictionary type fields with equations
                 parts = split_ex.split(sstr) # Split by whitespaces not adjacent to the (in)equality sign
                 for field in parts:
@@ -264,7 +642,8 @@ class ExtractorCommon(Extractor):
                         continue
                     if match := catch_ex.match(field):
                         key, boolean, equality, color, value = match.groups()
-                        if value is not None: 
+                        if value is not None:
+                            value = value.replace('"', "")
                             if boolean is None: # Simple Equality match
                                 if scope_boolean:
                                     last_scope[key] = {"sign": "=", "value":value}
@@ -281,7 +660,7 @@ class ExtractorCommon(Extractor):
                                     if equality is None: # Lone entries without key is assigned a default key
                                         if len(scope) == 1: # If this is the root scope, assume it's a faulty comment and skip
                                             continue
-                                        last_scope[f"index{len(last_scope)}"] = field
+                                        last_scope[f"index{len(last_scope)}"] = field.replace('"', "")
                                     else: # Incomplete equality match
                                         last_scope[key] = {}
                                         current_key = key
@@ -8,7 +8,8 @@ from src.helpers.utility import *
 from src.helpers.save_watch import *
 from src.helpers.extraction import *
 from src.checkers.manager import perform_checking
-import sys, json, os, glob, multiprocessing, queue
+from src.helpers.campaign_store import update_store
+import sys, json, os, glob, multiprocessing, concurrent.futures, sqlite3
 
 class Garibaldi_gui:
     """
@@ -195,17 +196,17 @@ class Main_Menu(tk.Tk, Garibaldi_gui):
 class SaveExtractor(tk.Toplevel, Garibaldi_gui):
     """
     Handles Save extractor menu
-    TODO Make a failure popup box
+    Saves are extracted by a pool of processes, each of them taking the next save, largest first, once done with the previous one.
     """
     def __init__(self, master):
         super().__init__(master)
         Garibaldi_gui.__init__(self)
         self.title("Save Extractor")
         self.extractor_config()
-        self.watch_thread = None
+        self.pool = None
+        self.futures = None # Future of the extraction of each save: save file
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.stop_event = master.stop_event
-        self.finish_events = None
     
     def extractor_config(self):
         """Generates the SaveExtractor menu"""
@@ -256,28 +257,25 @@ class SaveExtractor(tk.Toplevel, Garibaldi_gui):
                 return
         self.stop_button.config(state=tk.NORMAL)
         
-        campaign_folder = self.get_var("Campaign Folder")
+        campaign_folder = self.campaign_folder = self.get_var("Campaign Folder")
         folders = glob.glob(f"./saves/{campaign_folder}/*.v3") + glob.glob(f"./saves/{campaign_folder}/*/")
-        self.num_targets = len([f for f in folders if not is_reserved_folder(f)])
+        folders = sorted([f for f in folders if not is_reserved_folder(f)], key=extraction_size, reverse=True) # Largest first
+        self.num_targets = len(folders)
         self.completed = 0
-        folders = [[folder for j, folder in enumerate(folders) if j % self.var_thread.get() == i] for i in range(self.var_thread.get())]
         print(folders)
-        self.watch_thread = []
-        self.finish_events = [multiprocessing.Event() for _ in range(len(folders))]
-        self.queue = multiprocessing.Queue(self.var_thread.get())
-        for finish_event, folder_set in zip(self.finish_events, folders):
-            thread = multiprocessing.Process(target=extract_files, args=(campaign_folder, folder_set, self.stop_event, finish_event, self.queue, self.del_var.get()))
-            self.watch_thread.append(thread)
-            thread.start()
+        workers = self.var_thread.get()
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker, initargs=(self.stop_event,))
+        self.futures = {self.pool.submit(extract_file, campaign_folder, folder, delete=self.del_var.get(),
+                                         write_threads=get_write_threads(workers)): folder for folder in folders}
         self.after(1000, self.check_progress)
     
     def check_progress(self):
-        try:
-            value = self.queue.get(block=False)
-            self.completed += value
+        if self.futures is None:
+            return
+        completed = len([future for future in self.futures if future.done()])
+        if completed > self.completed:
+            self.completed = completed
             print(f"Progress: {self.completed}/{self.num_targets}")
-        except queue.Empty:
-            pass
         self.after(1000, self.check_progress)
 
     def on_stop(self):
@@ -292,17 +290,39 @@ class SaveExtractor(tk.Toplevel, Garibaldi_gui):
         self.destroy()
     
     def end_task(self):
-        if self.stop_event.is_set() or (self.finish_events is not None and all([event.is_set() for event in self.finish_events])):
-            if self.watch_thread is not None:
-                for thread in self.watch_thread:
-                    thread.join()
-            self.watch_thread = None
-            self.finish_events = None
+        if self.stop_event.is_set() or (self.futures is not None and all([future.done() for future in self.futures])):
+            if self.pool is not None:
+                self.pool.shutdown(wait=True, cancel_futures=True) # Saves being extracted stop at their next step
+                self.report_failures()
+                if VARIABLES["campaign_store"] and not self.stop_event.is_set():
+                    self.fill_store()
+            self.pool = None
+            self.futures = None
             self.toggle_tinkerable()
             self.stop_event.clear()
             self.stop_button.config(state=tk.DISABLED)
         self.after(500, self.end_task)
 
+    def report_failures(self):
+        """Shows the saves whose extraction failed, if any, the others being extracted regardless"""
+        failures = []
+        for future, folder in self.futures.items():
+            if future.cancelled() or isinstance(error := future.exception(), InterruptedError):
+                continue
+            if error is not None:
+                failures.append(str(error) if isinstance(error, RuntimeError) else f"{folder}: {error}") # i.e. a crashed worker process
+        if failures:
+            print("\n".join(failures))
+            messagebox.showerror("Extraction failed", f"{len(failures)} of {self.num_targets} saves failed to be extracted:\n" + "\n".join(failures))
+
+    def fill_store(self):
+        """Stores the extracted saves in the campaign store (see src/helpers/campaign_store.py), enabled by campaign_store of variables.json"""
+        try:
+            update_store(self.campaign_folder).close()
+        except sqlite3.Error as e:
+            print(e)
+            messagebox.showerror("Campaign store failed", f"The extracted saves couldn't be stored in the campaign store:\n{e}")
+
 
 """
 TODO Put the interactive plots as an integrated element on GUI
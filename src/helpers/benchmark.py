@@ -0,0 +1,212 @@
+"""
+Benchmarks of the extraction pipeline. Run from the repository root, i.e.
+python -m src.helpers.benchmark extractor saves/campaign/save/save.txt
+python -m src.helpers.benchmark unquote saves/campaign/save/save.txt
+python -m src.helpers.benchmark typed saves/campaign/save/save.txt
+python -m src.helpers.benchmark interning saves/campaign/save/save.txt
+python -m src.helpers.benchmark storage saves/campaign/save/save.txt [codec...]
+"""
+import sys, os, time, multiprocessing, tempfile, shutil
+from src.extractor import ExtractorSave
+from src.helpers.storage import read_manifest, read_file, write_file, get_section_address
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+def peak_rss():
+    """
+    Peak resident set size of the current process in bytes, or None if unavailable on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # Linux reports kilobytes
+
+def run_isolated(func, *args):
+    """
+    Run a function in a fresh process so that its peak memory isn't polluted by earlier runs.
+    Returns the function's output, the elapsed time and the peak RSS of the process.
+    """
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(_timed, (func, *args))
+
+def _timed(func, *args):
+    t0 = time.perf_counter()
+    out = func(*args)
+    return out, time.perf_counter() - t0, peak_rss()
+
+def _extract(address, chunk_size):
+    ExtractorSave(address, chunk_size=chunk_size)
+
+def benchmark_extractor(address, chunk_sizes=(None, 1 << 16, 1 << 20, 1 << 24)):
+    """
+    Compare the throughput and the peak memory of ExtractorSave reading a melted save with different chunk sizes.
+    chunk_size None reads the whole save at once like the extractor used to.
+    """
+    size = os.path.getsize(address)
+    print(f"{address}: {size / 1e6:.1f} MB")
+    results = []
+    for chunk_size in chunk_sizes:
+        _, length, rss = run_isolated(_extract, address, chunk_size)
+        label = "whole file" if chunk_size is None else f"{chunk_size} chars"
+        rss_text = "n/a" if rss is None else f"{rss / 1e6:.1f} MB"
+        print(f"{label:>16}: {length:.2f} s, {size / length / 1e6:.2f} MB/s, peak RSS {rss_text}")
+        results.append({"chunk_size": chunk_size, "time": length, "bytes_per_second": size / length, "peak_rss": rss})
+    return results
+
+def count_quoted(scope):
+    """
+    Number of string values, lone entries and list items of a data tree still containing quotation marks
+    """
+    count = 0
+    for value in scope.values():
+        if isinstance(value, str):
+            count += '"' in value
+        elif isinstance(value, dict):
+            count += count_quoted(value)
+        elif isinstance(value, list):
+            count += sum(['"' in item for item in value if isinstance(item, str)])
+    return count
+
+def _parse_unquote(address):
+    t0 = time.perf_counter()
+    data = ExtractorSave(address)
+    parsing = time.perf_counter() - t0
+    quoted = count_quoted(data.data)
+    t0 = time.perf_counter()
+    data.unquote()
+    return {"parse": parsing, "unquote": time.perf_counter() - t0, "quoted": quoted}
+
+def benchmark_unquote(address):
+    """
+    Measure the extraction time saved per save by stripping quotation marks while parsing (see ExtractorSave) instead of
+    walking the parsed tree with Extractor.unquote afterwards, as the extraction used to. The walk is timed on the parsed
+    tree in the same fresh process. The parse includes the stripping, so the time saved is the walk minus the little
+    the stripping adds to the parse. No quoted value may be left.
+    """
+    size = os.path.getsize(address)
+    times, _, rss = run_isolated(_parse_unquote, address)
+    rss_text = "n/a" if rss is None else f"{rss / 1e6:.1f} MB"
+    print(f"{address}: {size / 1e6:.1f} MB, peak RSS {rss_text}")
+    print(f"{'parse':>8}: {times['parse']:.2f} s, quotation marks stripped while parsing, {times['quoted']} quoted values left")
+    print(f"{'unquote':>8}: {times['unquote']:.2f} s of walking the tree no longer run per save, {times['unquote'] / (times['parse'] + times['unquote']):.1%} of parse + unquote")
+    return times | {"peak_rss": rss}
+
+def _extract_to(address, output, typed):
+    ExtractorSave(address, typed=typed).write(output, separate=True)
+
+def _check(folder):
+    from src.checkers.manager import SaveManager
+    from src.checkers.check_demographics import CheckDemographics
+    from src.checkers.check_finance import CheckFinance
+    from src.checkers.check_prestige import CheckPrestige
+    checkers = [CheckDemographics(), CheckFinance(), CheckPrestige()] # Prestige depends on finance, which depends on demographics
+    t0 = time.perf_counter()
+    save = SaveManager(folder, checkers)
+    times = {"load": time.perf_counter() - t0}
+    for checker in checkers:
+        t0 = time.perf_counter()
+        checker.check(save.cache)
+        times[type(checker).__name__] = time.perf_counter() - t0
+    return times
+
+def benchmark_typed(address):
+    """
+    Compare the demographics and prestige checkers (and finance, which prestige depends on) on the data of a melted save
+    extracted with strings only and with typed values (see ExtractorSave). Each variant is extracted into a temporary
+    save folder and checked in a fresh process.
+    """
+    results = dict()
+    for typed in [False, True]:
+        folder = tempfile.mkdtemp(prefix="garibaldi_")
+        try:
+            _, extraction, _ = run_isolated(_extract_to, address, folder, typed)
+            times, _, rss = run_isolated(_check, folder)
+        finally:
+            shutil.rmtree(folder)
+        label = "typed" if typed else "strings"
+        rss_text = "n/a" if rss is None else f"{rss / 1e6:.1f} MB"
+        print(f"{label:>8}: extraction {extraction:.2f} s, " + ", ".join([f"{k} {v:.2f} s" for k, v in times.items()]) + f", peak RSS {rss_text}")
+        results[label] = times | {"extraction": extraction, "peak_rss": rss}
+    return results
+
+def _extract_interning(address, output, interning):
+    ExtractorSave(address, interning=interning).write(output, separate=True)
+
+def _load(folder, topics):
+    from src.helpers.utility import load_save
+    load_save(topics, folder)
+
+def folder_size(folder):
+    """
+    Total size in bytes of the files in a folder
+    """
+    return sum([os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(folder) for file in files])
+
+def benchmark_interning(address, topics=("pops", "building_manager")):
+    """
+    Compare the on-disk size of the extracted data of a melted save and the peak memory of loading pops and
+    building_manager from it (as SaveManager does through load_save), with and without interning (see ExtractorSave).
+    """
+    results = dict()
+    for interning in [False, True]:
+        folder = tempfile.mkdtemp(prefix="garibaldi_")
+        try:
+            _, extraction, _ = run_isolated(_extract_interning, address, folder, interning)
+            size = folder_size(f"{folder}/extracted_save")
+            _, loading, rss = run_isolated(_load, folder, list(topics))
+        finally:
+            shutil.rmtree(folder)
+        label = "interned" if interning else "plain"
+        rss_text = "n/a" if rss is None else f"{rss / 1e6:.1f} MB"
+        print(f"{label:>8}: extraction {extraction:.2f} s, {size / 1e6:.2f} MB on disk, loading {loading:.2f} s, peak RSS {rss_text}")
+        results[label] = {"extraction": extraction, "size": size, "loading": loading, "peak_rss": rss}
+    return results
+
+STORAGE_CODECS = ["none"] + [f"zlib-{level}" for level in range(1, 10)] + ["gzip-9", "bz2", "lzma"]
+
+def benchmark_storage(address, *codecs):
+    """
+    Compare the codecs of the extracted data (see src/helpers/storage.py) on a melted save: write time, read time and
+    size of every stored file (root sections and shards) and in total. Default codecs are STORAGE_CODECS.
+    """
+    codecs = list(codecs) or STORAGE_CODECS
+    folder = tempfile.mkdtemp(prefix="garibaldi_")
+    try:
+        ExtractorSave(address).write(folder, separate=True, codec="none")
+        sections = {section: read_file(get_section_address(folder, section, "none"), "none") for section in read_manifest(folder)["codecs"]}
+        results = dict()
+        for codec in codecs:
+            results[codec] = dict()
+            for section, data in sections.items():
+                file = get_section_address(folder, section, codec)
+                t0 = time.perf_counter()
+                write_file(file, data, codec)
+                writing = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                read_file(file, codec)
+                reading = time.perf_counter() - t0
+                size = os.path.getsize(file)
+                results[codec][section] = {"write": writing, "read": reading, "size": size}
+    finally:
+        shutil.rmtree(folder)
+    for section in list(sections) + ["total"]:
+        print(section)
+        for codec in codecs:
+            if section == "total":
+                result = {k: sum([v[k] for v in results[codec].values()]) for k in ["write", "read", "size"]}
+                results[codec]["total"] = result
+            else:
+                result = results[codec][section]
+            print(f"{codec:>8}: write {result['write']:.3f} s, read {result['read']:.3f} s, {result['size'] / 1e6:.2f} MB")
+    return results
+
+BENCHMARKS = {"extractor": benchmark_extractor, "unquote": benchmark_unquote, "typed": benchmark_typed, "interning": benchmark_interning, "storage": benchmark_storage}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python -m src.helpers.benchmark [{'/'.join(BENCHMARKS)}] <address>")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
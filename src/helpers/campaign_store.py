@@ -0,0 +1,143 @@
+"""
+Optional campaign-wide SQLite store of flattened entities of every save of a campaign, keyed by (save_date, id) and
+indexed by (id, save_date) so that the history of an entity over the campaign is a single index lookup.
+It's kept in saves/{campaign_folder}/campaign_data/campaign.sqlite, and filled with the saves of a campaign once they're
+extracted by the GUI if campaign_store is true in variables.json, or by hand. Run from the repository root, i.e.
+python -m src.helpers.campaign_store autosaves                   (store the saves not stored yet)
+python -m src.helpers.campaign_store autosaves countries infamy 23 (history of the infamy of the country 23)
+"""
+import sys, os, glob, sqlite3
+import numpy as np
+from src.helpers.utility import *
+from src.checkers.checkers_functions import get_save_date
+from src.helpers.columnar import BUILDINGS_COLUMNS, load_columns, state_countries, group_sum, workforce_by_workplace
+
+# Fields of the save's entities stored in each table and their SQL types. Missing fields are NULL
+COUNTRY_FIELDS = {"definition": "TEXT", "infamy": "REAL", "capital": "INTEGER", "country_type": "TEXT"}
+STATE_FIELDS = {"country": "INTEGER", "incorporation": "REAL", "arable_land": "INTEGER"}
+# Sums of the pops living in each state and country
+POPS_AGGREGATES = {"population": "INTEGER", "workforce": "INTEGER", "dependents": "INTEGER", "num_literate": "INTEGER", "wealth": "REAL"}
+# Columns of the buildings (see src/helpers/columnar.py) and the workforce they employ
+BUILDING_FIELDS = ({"building": "TEXT"} | {field: "INTEGER" if dtype == np.int64 else "REAL" for field, dtype in BUILDINGS_COLUMNS.items()}
+                   | {"workforce": "INTEGER"})
+TABLES = {"countries": COUNTRY_FIELDS | POPS_AGGREGATES, "states": STATE_FIELDS | POPS_AGGREGATES, "buildings": BUILDING_FIELDS}
+SQL_TYPES = {"TEXT": str, "REAL": float, "INTEGER": lambda value: int(float(value))}
+
+def get_store_address(campaign_folder):
+    return f"saves/{campaign_folder}/campaign_data/campaign.sqlite"
+
+def open_store(campaign_folder):
+    """
+    Open the store of a campaign, creating its tables if needed. Returns a sqlite3 connection.
+    """
+    os.makedirs(f"saves/{campaign_folder}/campaign_data", exist_ok=True)
+    connection = sqlite3.connect(get_store_address(campaign_folder))
+    connection.execute("CREATE TABLE IF NOT EXISTS saves (save_date TEXT PRIMARY KEY, folder TEXT NOT NULL, version TEXT)")
+    for table, fields in TABLES.items():
+        columns = ", ".join([f"{field} {sql_type}" for field, sql_type in fields.items()])
+        connection.execute(f"CREATE TABLE IF NOT EXISTS {table} (save_date TEXT NOT NULL, id INTEGER NOT NULL, {columns}, PRIMARY KEY (save_date, id))")
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_history ON {table} (id, save_date)")
+    connection.commit()
+    return connection
+
+def sql_value(entity, field, sql_type):
+    if not isinstance(entity, dict) or field not in entity or isinstance(entity[field], (dict, list)):
+        return None
+    try:
+        return SQL_TYPES[sql_type](entity[field])
+    except ValueError:
+        return None
+
+def pops_aggregates(pops, ids):
+    """
+    Sums of POPS_AGGREGATES of the pops by an array of ids of the same length (i.e. their location), as a dictionary of
+    id to a tuple of sums
+    """
+    values = {"population": pops["workforce"] + pops["dependents"]} | {field: pops[field] for field in POPS_AGGREGATES if field != "population"}
+    valid = ids >= 0
+    sums = []
+    for field in POPS_AGGREGATES:
+        unique, total = group_sum(ids[valid], values[field][valid])
+        sums.append(total if SQL_TYPES[POPS_AGGREGATES[field]] is float else total.astype(np.int64))
+    return {i: tuple([total[row].item() for total in sums]) for row, i in enumerate(unique.tolist())}
+
+def store_save(connection, address):
+    """
+    Store the entities of an extracted save folder, replacing the ones previously stored with the same date
+    """
+    year, month, day = get_save_date(address)
+    save_date = f"{int(year):04d}-{int(month):02d}-{int(day):02d}" # Sorted chronologically as text
+    data = load_save(["meta_data", "country_manager", "states"], address)
+    countries = data["country_manager"]["database"]
+    states = data["states"]["database"]
+    pops = load_columns(address, "pops")
+    buildings = load_columns(address, "building_manager")
+
+    state_pops = pops_aggregates(pops, pops["location"])
+    located = pops["location"] >= 0
+    pop_countries = np.full(len(pops["location"]), -1, dtype=np.int64)
+    pop_countries[located] = state_countries(pops["location"][located], states)
+    country_pops = pops_aggregates(pops, pop_countries)
+    workforce = workforce_by_workplace(pops)
+    null_pops = (None,) * len(POPS_AGGREGATES)
+
+    rows = {"countries": [], "states": [], "buildings": []}
+    for key, country in countries.items():
+        if isinstance(country, dict):
+            rows["countries"].append((save_date, int(key), *[sql_value(country, field, sql_type) for field, sql_type in COUNTRY_FIELDS.items()],
+                                      *country_pops.get(int(key), null_pops)))
+    for key, state in states.items():
+        if isinstance(state, dict):
+            rows["states"].append((save_date, int(key), *[sql_value(state, field, sql_type) for field, sql_type in STATE_FIELDS.items()],
+                                   *state_pops.get(int(key), null_pops)))
+    alive = np.flatnonzero(~buildings["dead"])
+    ids = buildings["id"][alive].tolist()
+    names = buildings["building_names"][buildings["building"][alive]].tolist()
+    fields = [[None if value != value else value for value in buildings[field][alive].tolist()] for field in BUILDINGS_COLUMNS] # NaN is NULL
+    rows["buildings"] = [(save_date, i, name, *values, workforce.get(i, 0)) for i, name, *values in zip(ids, names, *fields)]
+
+    with connection: # One transaction for the whole save
+        connection.execute("INSERT OR REPLACE INTO saves VALUES (?, ?, ?)", (save_date, os.path.abspath(address), str(data["meta_data"]["version"])))
+        for table, table_rows in rows.items():
+            connection.execute(f"DELETE FROM {table} WHERE save_date = ?", (save_date,))
+            connection.executemany(f"INSERT INTO {table} VALUES ({', '.join(['?'] * (len(TABLES[table]) + 2))})", table_rows)
+    return save_date
+
+def update_store(campaign_folder, reset=False):
+    """
+    Store every extracted save of a campaign which isn't stored yet, or all of them if reset. Returns the store.
+    A save missing some of its data, i.e. whose extraction failed, is reported and left out.
+    """
+    connection = open_store(campaign_folder)
+    stored = set([row[0] for row in connection.execute("SELECT folder FROM saves")])
+    for folder in glob.glob(os.path.join("saves", campaign_folder, "*")):
+        if not os.path.isdir(f"{folder}/extracted_save") or is_reserved_folder(folder):
+            continue
+        if reset or os.path.abspath(folder) not in stored:
+            t0 = time.time()
+            try:
+                save_date = store_save(connection, folder)
+            except (FileNotFoundError, KeyError) as e:
+                print(f"Failed to store {folder}: {e}")
+                continue
+            print(f"Stored {folder} as {save_date} in {time.time() - t0} seconds")
+    return connection
+
+def get_history(connection, table, field, entity_id):
+    """
+    Value of a field of an entity (i.e. infamy of the country 23) in every stored save, as a list of (save_date, value)
+    in chronological order
+    """
+    if table not in TABLES or field not in TABLES[table]:
+        raise KeyError(f"No field {field} in table {table}, expected one of {TABLES.get(table, TABLES)}")
+    return connection.execute(f"SELECT save_date, {field} FROM {table} WHERE id = ? ORDER BY save_date", (int(entity_id),)).fetchall()
+
+if __name__ == "__main__":
+    if len(sys.argv) not in [2, 5]:
+        print("Usage: python -m src.helpers.campaign_store <campaign_folder> [<table> <field> <id>]")
+        sys.exit(1)
+    store = update_store(sys.argv[1])
+    if len(sys.argv) == 5:
+        for save_date, value in get_history(store, *sys.argv[2:]):
+            print(f"{save_date}: {value}")
+    store.close()
@@ -0,0 +1,213 @@
+"""
+Columnar (struct of arrays) forms of the large databases of a save, stored as NumPy arrays alongside the extracted save
+in extracted_save/{topic}_columns.npz
+"""
+import os
+import numpy as np
+from src.helpers.storage import read_manifest, get_shards, iter_shards
+
+# Numerical fields of a pop and their column types. Missing fields are 0, missing ids are -1
+POPS_COLUMNS = {"workforce": np.int64, "dependents": np.int64, "num_literate": np.int64, "location": np.int64,
+                "workplace": np.int64, "loyalists_and_radicals": np.float64, "wealth": np.float64}
+POPS_IDS = ["location", "workplace"]
+# Numerical fields of a building and their column types. Missing floats are NaN, missing ids are -1 and missing levels are 0
+BUILDINGS_COLUMNS = {"state": np.int64, "levels": np.int64, "cash_reserves": np.float64, "throughput": np.float64,
+                     "government_dividends": np.float64}
+BUILDINGS_IDS = ["state"]
+
+def get_columns_address(address, topic):
+    return f"{address}/extracted_save/{topic}_columns.npz"
+
+def has_columns(address, topic):
+    return os.path.exists(get_columns_address(address, topic))
+
+def write_columns(address, topic, columns):
+    """
+    Write the columns of a topic into a compressed .npz file of the save folder
+    """
+    np.savez_compressed(get_columns_address(address, topic), **columns)
+
+def read_columns(address, topic):
+    """
+    Read the columns of a topic from the save folder. Returns None if they were never written.
+    """
+    if not has_columns(address, topic):
+        return None
+    with np.load(get_columns_address(address, topic), allow_pickle=False) as file:
+        return {key: file[key] for key in file.files}
+
+def columnar_requirements(requirements, address, columnar):
+    """
+    Remove the topics whose columns are stored in the save folder, or can be built from its shards (see get_columns), from
+    a list of requirements, if they are listed in columnar, i.e. only read through their columns (see Checker.columnar)
+    """
+    manifest = read_manifest(address)
+    return [topic for topic in requirements if topic not in columnar or not (has_columns(address, topic) or get_shards(manifest, topic) > 0)]
+
+def write_all_columns(address, data):
+    """
+    Write the columns of every topic of COLUMNAR_TOPICS present in a save's data tree
+    """
+    for topic, converter in COLUMNAR_TOPICS.items():
+        if topic in data:
+            write_columns(address, topic, converter(data[topic]["database"]))
+
+def encode(values):
+    """
+    Encode a list of strings into integer codes and the array of names the codes refer to
+    """
+    names, codes = np.unique(np.array(values, dtype=str), return_inverse=True)
+    return codes.astype(np.int32), names
+
+def pops_to_columns(database):
+    """
+    Convert the pops database (save_data["pops"]["database"]) into columns: the id of every pop, its type as a code
+    into type_names and the fields of POPS_COLUMNS. Dead pops are left out.
+    """
+    pops = [(pop_id, pop) for pop_id, pop in database.items() if isinstance(pop, dict)]
+    columns = {"id": np.array([int(pop_id) for pop_id, _ in pops], dtype=np.int64)}
+    columns["type"], columns["type_names"] = encode([pop["type"] if "type" in pop else "" for _, pop in pops])
+    for field, dtype in POPS_COLUMNS.items():
+        null = -1 if field in POPS_IDS else 0
+        columns[field] = np.array([pop[field] if field in pop else null for _, pop in pops], dtype=np.float64).astype(dtype)
+    return columns
+
+def buildings_to_columns(database):
+    """
+    Convert the building database (save_data["building_manager"]["database"]) into columns: the id of every building,
+    its type as a code into building_names, the fields of BUILDINGS_COLUMNS and the dead flag.
+    Production methods are stored flat as codes into production_method_names, the ones of the building i being
+    production_methods[production_methods_offsets[i]:production_methods_offsets[i + 1]].
+    The output goods are a sparse matrix of (goods_row, goods_index, goods_value) triplets, goods_row being the row of
+    the building and goods_index the index of the goods in the goods definitions.
+    """
+    buildings = [(building_id, building) for building_id, building in database.items() if isinstance(building, dict)]
+    columns = {"id": np.array([int(building_id) for building_id, _ in buildings], dtype=np.int64)}
+    columns["building"], columns["building_names"] = encode([building["building"] if "building" in building else "" for _, building in buildings])
+    for field, dtype in BUILDINGS_COLUMNS.items():
+        null = -1 if field in BUILDINGS_IDS else 0 if dtype == np.int64 else np.nan
+        columns[field] = np.array([building[field] if field in building else null for _, building in buildings], dtype=np.float64).astype(dtype)
+    columns["dead"] = np.array([building["dead"] in ["yes", True] if "dead" in building else False for _, building in buildings], dtype=bool)
+
+    production_methods = [building["production_methods"]["value"] if "value" in building.get("production_methods", dict()) else []
+                          for _, building in buildings]
+    columns["production_methods_offsets"] = np.cumsum([0] + [len(pms) for pms in production_methods], dtype=np.int64)
+    columns["production_methods"], columns["production_method_names"] = encode([pm for pms in production_methods for pm in pms])
+
+    goods_row, goods_index, goods_value = [], [], []
+    for row, (_, building) in enumerate(buildings):
+        if not isinstance(goods := building.get("output_goods", dict()).get("goods"), dict):
+            continue
+        for goods_key, output in goods.items():
+            goods_row.append(row)
+            goods_index.append(int(goods_key))
+            goods_value.append(output["value"])
+    columns["goods_row"] = np.array(goods_row, dtype=np.int64)
+    columns["goods_index"] = np.array(goods_index, dtype=np.int64)
+    columns["goods_value"] = np.array(goods_value, dtype=np.float64)
+    return columns
+
+COLUMNAR_TOPICS = {"pops": pops_to_columns, "building_manager": buildings_to_columns} # Topics with a columnar form and their converters
+ENCODED_COLUMNS = {"type_names": "type", "building_names": "building", "production_method_names": "production_methods"} # Names: codes
+
+def concat_columns(parts):
+    """
+    Concatenate the columns of consecutive parts of a database (i.e. its shards), encoding the encoded columns again with
+    the names of all parts and shifting the offsets and rows referring to other columns
+    """
+    if len(parts) == 1:
+        return parts[0]
+    columns = dict()
+    rows = np.cumsum([0] + [len(part["id"]) for part in parts])
+    for key in parts[0]:
+        if key in ENCODED_COLUMNS:
+            codes = ENCODED_COLUMNS[key]
+            columns[key] = np.unique(np.concatenate([part[key] for part in parts]))
+            columns[codes] = np.concatenate([np.searchsorted(columns[key], part[key]).astype(np.int32)[part[codes]] for part in parts]).astype(np.int32)
+        elif key == "production_methods_offsets":
+            starts = np.cumsum([0] + [len(part["production_methods"]) for part in parts])
+            columns[key] = np.concatenate([parts[0][key]] + [part[key][1:] + starts[i] for i, part in enumerate(parts) if i > 0])
+        elif key == "goods_row":
+            columns[key] = np.concatenate([part[key] + rows[i] for i, part in enumerate(parts)])
+        elif key not in ENCODED_COLUMNS.values():
+            columns[key] = np.concatenate([part[key] for part in parts])
+    return columns
+
+def columns_from_shards(address, topic):
+    """
+    Convert a topic stored in a save folder into columns one shard at a time, never holding its whole database in memory
+    """
+    return concat_columns([COLUMNAR_TOPICS[topic](database) for database in iter_shards(address, topic)])
+
+def load_columns(address, topic):
+    """
+    Columns of a topic of a save folder, read if stored or else converted from its database one shard at a time
+    """
+    columns = read_columns(address, topic)
+    return columns_from_shards(address, topic) if columns is None else columns
+
+def get_columns(cache, topic):
+    """
+    Columns of a topic of the save being checked, read from the save folder if stored or else converted from the loaded
+    database or from its shards. They are kept in the cache for the next checkers.
+    """
+    if f"{topic}_columns" not in cache:
+        columns = read_columns(cache["address"], topic)
+        if columns is None and topic not in cache["save_data"]: # Left out by columnar_requirements
+            columns = columns_from_shards(cache["address"], topic)
+        elif columns is None:
+            columns = COLUMNAR_TOPICS[topic](cache["save_data"][topic]["database"])
+        cache[f"{topic}_columns"] = columns
+    return cache[f"{topic}_columns"]
+
+def get_pops_columns(cache):
+    return get_columns(cache, "pops")
+
+def get_buildings_columns(cache):
+    return get_columns(cache, "building_manager")
+
+def type_mask(columns, name, column="type"):
+    """
+    Boolean mask of the rows of an encoded column (type for pops, building for buildings) equal to name, or satisfying name if it's a function
+    """
+    names = columns[f"{column}_names"]
+    if callable(name):
+        codes = np.flatnonzero([name(str(n)) for n in names])
+    else:
+        codes = np.flatnonzero(names == name)
+    return np.isin(columns[column], codes)
+
+def id_keys(database):
+    """
+    Map integer ids to the keys of a database, whether they are strings or already integers (typed extraction)
+    """
+    return {int(key): key for key in database if str(key).isdigit()}
+
+def map_ids(ids, mapping):
+    """
+    Apply a function to an array of ids, calling it once for each unique id
+    """
+    unique, inverse = np.unique(ids, return_inverse=True)
+    return np.array([mapping(i) for i in unique.tolist()], dtype=np.int64)[inverse]
+
+def state_countries(state_ids, states):
+    """
+    Id of the country owning each state of an array of state ids
+    """
+    state_keys = id_keys(states)
+    return map_ids(state_ids, lambda state: int(states[state_keys[state]]["country"]))
+
+def group_sum(ids, values):
+    """
+    Sum values by id. Returns the unique ids and their sums.
+    """
+    unique, inverse = np.unique(ids, return_inverse=True)
+    return unique, np.bincount(inverse, weights=values, minlength=len(unique))
+
+def workforce_by_workplace(columns):
+    """
+    Total workforce employed in each building, as a dictionary of building id to workforce
+    """
+    employed = columns["workplace"] >= 0
+    workplaces, workforce = group_sum(columns["workplace"][employed], columns["workforce"][employed])
+    return dict(zip(workplaces.tolist(), workforce.astype(np.int64).tolist()))
@@ -30,21 +30,26 @@ def get_localization(address):
 def get_all_localization():
     """
     Returns every single localization definition in the game for a language.
+
+    It's read once per process (see registered_definitions) and cached on disk (see load_definitions) until a .yml file
+    of the language or of the mod is added, removed or modified.
     """
     user_variables = jopen("./user_variables.json")
+    key = ("localization", os.path.abspath(user_variables["Localization Directory"]), user_variables["Localization Language"], user_variables["Selected Mod"])
+    return registered_definitions(key, lambda: load_all_localization(user_variables, key))
+
+def load_all_localization(user_variables, key):
+    """
+    Read every localization file of the language, then of the mod, through the on-disk cache
+    """
     lcl_files = list(Path(user_variables["Localization Directory"] + f"//{user_variables['Localization Language']}").rglob("*.yml"))
-    dicts = []
-    for f in lcl_files:
-        names = get_localization(f)
-        dicts.append(names)
-    localization = dict()
-    for d in dicts:
-        localization.update(d)
     lcl_mod_files = list(Path(user_variables["Selected Mod"] + f"//localization//{user_variables['Localization Language']}").rglob("*.yml"))
-    dicts_mod = []
-    for f in lcl_mod_files:
-        names = get_localization(f)
-        dicts_mod.append(names)
-    for d in dicts_mod:
-        localization.update(d)
+    addresses = [str(f) for f in lcl_files + lcl_mod_files]
+    if (localization := read_cached_definitions(addresses, key)) is not None:
+        return localization
+    stamp = get_definitions_stamp(addresses)
+    localization = dict()
+    for f in addresses: # Mod files come last to override the game's
+        localization.update(get_localization(f))
+    write_cached_definitions(stamp, key, localization)
     return localization
\ No newline at end of file
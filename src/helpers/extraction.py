@@ -2,86 +2,264 @@
 File containing the save extraction functions
 """
 from src.checkers.checkers_functions import rename_folder_to_date
-from src.extractor import ExtractorSave
-from src.helpers.melt import melt
+from src.extractor import ExtractorSave, write_index, read_index, get_index_address, index_save, hash_sections
+from src.helpers.melt import melt, melt_buffer, load_rakaly, finish_melt
+from src.helpers.columnar import COLUMNAR_TOPICS, write_all_columns, has_columns, get_columns_address
+from src.helpers.storage import read_manifest, write_manifest, has_section, copy_sections, link_file
 from src.helpers.utility import *
-import time, shutil, re
+import time, shutil, re, io, platform
 from glob import glob
 
+def date_order(date):
+    """Number of a [year, month, day] date growing with the date, for comparing how far apart dates are"""
+    year, month, day = [int(i) for i in date]
+    return (year * 12 + month) * 31 + day
+
+def get_previous_save(save_file, game_date):
+    """
+    The save folder of the same campaign, apart from save_file, closest in game date to game_date ([year, month, day]),
+    the earlier one on a tie. Only the saves done being extracted count: the hashes of their root sections (see
+    hash_sections) and their game date are recorded in their manifest last, and a folder extracted from a .v3 file still
+    next to it is yet to be renamed. Returns None if there is none.
+    """
+    previous, distance = None, None
+    for folder in glob(os.path.join(os.path.dirname(os.path.abspath(save_file)), "*")):
+        if folder == os.path.abspath(save_file) or is_reserved_folder(folder) or not os.path.isdir(folder) or os.path.exists(f"{folder}.v3"):
+            continue
+        manifest = read_manifest(folder) # Empty if the folder was renamed meanwhile
+        if "hashes" not in manifest or "game_date" not in manifest:
+            continue
+        difference = date_order(game_date) - date_order(manifest["game_date"])
+        if distance is None or (abs(difference), difference < 0) < distance:
+            previous, distance = folder, (abs(difference), difference < 0)
+    return previous
+
+def has_other_saves(save_file):
+    """
+    Whether the campaign of the save folder save_file has other saves, extracted or yet to be, i.e. .v3 files and save
+    folders. Only then can its sections be reused from or by another save, and are worth hashing (see extract_save_file).
+    """
+    for address in glob(os.path.join(os.path.dirname(os.path.abspath(save_file)), "*")):
+        if address in [os.path.abspath(save_file), f"{os.path.abspath(save_file)}.v3"] or is_reserved_folder(address):
+            continue
+        if address.endswith(".v3") or os.path.isdir(address):
+            return True
+    return False
+
+def reuse_sections(previous, save_file, hashes, focuses=None, typed=False, columnar=False):
+    """
+    Copy the sections of the save folder previous whose raw text is unchanged (see hash_sections) into save_file, with
+    their columns. Returns the copied sections, none if they couldn't be copied, i.e. if previous was removed meanwhile,
+    so that they're parsed instead.
+    """
+    previous_manifest = read_manifest(previous)
+    reused = [section for section, digest in hashes.items() if section != "meta_data" and (focuses is None or section in focuses)
+              and previous_manifest.get("hashes", dict()).get(section) == digest and previous_manifest.get("typed", False) == typed
+              and has_section(previous, section, previous_manifest)]
+    if not reused:
+        return []
+    try:
+        copy_sections(previous, save_file, reused)
+    except OSError as e:
+        print(f"Failed to reuse the sections of {previous}, parsing them instead: {e}")
+        return []
+    if columnar:
+        for topic in COLUMNAR_TOPICS:
+            if topic in reused and has_columns(previous, topic):
+                try:
+                    link_file(get_columns_address(previous, topic), get_columns_address(save_file, topic))
+                except OSError: # Built from the tree when needed instead
+                    if os.path.exists(get_columns_address(save_file, topic)):
+                        os.remove(get_columns_address(save_file, topic))
+    print(f"Reused {len(reused)} of {len(hashes)} root sections from {previous}")
+    return reused
+
 # Fully extract save file
-def extract_save_file(save_file):
+def get_write_threads(workers=1):
+    """
+    Number of threads writing the sections of each save (see SectionWriter): write_threads of variables.json if set,
+    otherwise the CPUs shared among the workers extracting saves at the same time
+    """
+    if VARIABLES["write_threads"]:
+        return VARIABLES["write_threads"]
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def extract_save_file(save_file, focuses=None, processes=1, melted=None, typed=False, columnar=False, codec=None, reuse=True,
+                      write_threads=None):
     """
     Handles extraction of a single save file.
+    focuses (list, optional): Root sections to be extracted, i.e. the union of the checkers' requirements. Default is None (Extract all)
+    processes (int, optional): Number of processes parsing the large sections of the save in parallel. Default is 1
+    melted (bytes or text stream, optional): The save melted in memory (see melt_buffer) or the output stream of the melter
+    (see melt) to be parsed instead of save.txt
+    typed (bool, optional): Store numbers, yes/no and dates with their types instead of strings (see ExtractorSave). Default is False
+    columnar (bool, optional): Also store pops and buildings as NumPy columns (see src/helpers/columnar.py). Default is False
+    codec (str, optional): Codec of the extracted files, i.e. "zlib-1" (see src/helpers/storage.py). Default is None (storage_codec of variables.json)
+    reuse (bool, optional): Hash the raw text of each root section and reuse the extracted sections of the closest save of
+    the campaign in game date (see get_previous_save) whose text is unchanged instead of parsing them again. Only done if
+    the campaign has other saves (see has_other_saves), and saves melted into a stream are always parsed in full. Default is True
+    write_threads (int, optional): Number of threads writing the sections. Default is None (see get_write_threads)
     """
+    source = f"{save_file}/save.txt" if melted is None else melted
+    if focuses is not None and "meta_data" not in focuses: # Needed to name the save folder
+        focuses = list(focuses) + ["meta_data"]
+    reuse = reuse and has_other_saves(save_file)
+    index = None
+    if melted is None and (focuses is not None or reuse) and (index := read_index(source)) is None: # Allows reading only the focused sections
+        index = t_execute(write_index)(source)
+    elif isinstance(melted, (bytes, bytearray)) and reuse:
+        index = t_execute(index_save)(melted)
+    hashes, reused = None, []
+    if reuse and index is not None and "meta_data" in index: # Also hashed without a previous save, for the next ones
+        hashes = t_execute(hash_sections)(source, index)
+        game_date = split_date(ExtractorSave(source, focuses=["meta_data"], index=index).data["meta_data"]["game_date"])
+        if (previous := get_previous_save(save_file, game_date)) is not None: # Linked first, so that it may be renamed meanwhile
+            reused = reuse_sections(previous, save_file, hashes, focuses, typed, columnar)
+    if write_threads is None:
+        write_threads = get_write_threads()
     try:
-        data = t_execute(ExtractorSave)(f"{save_file}/save.txt")
-        t_execute(data.unquote)()
-        t_execute(data.write)(save_file, separate=True)
+        # Sections are written while the next ones are parsed, which only pays off with several CPUs to share the work
+        background = save_file if write_threads > 1 else None
+        data = t_execute(ExtractorSave)(source, focuses=focuses, processes=processes, typed=typed, skip=reused, index=index,
+                                        output=background, codec=codec, write_threads=write_threads)
     except InterruptedError as e:
         raise InterruptedError("Stop event set")
     except Exception as e:
-        data = ExtractorSave(f"{save_file}/save.txt", pline=True)
+        if isinstance(source, (str, bytes, bytearray)): # Parse again printing every segment to locate the failure, a stream can't be read again
+            try:
+                ExtractorSave(source, focuses=focuses, pline=True, typed=typed)
+            except Exception:
+                pass
+        raise e
+    t_execute(data.write)(save_file, separate=True, codec=codec, threads=write_threads)
+    if columnar:
+        t_execute(write_all_columns)(save_file, data.data)
+    if hashes is not None: # Recorded last, see get_previous_save
+        manifest = read_manifest(save_file)
+        write_manifest(save_file, {"hashes": {section: digest for section, digest in hashes.items() if has_section(save_file, section, manifest)},
+                                   "reused": reused, "game_date": game_date})
+
+worker_stop_event = None # Stop event of an extraction worker process (see init_worker)
+
+def init_worker(stop_event):
+    """
+    Initializer of the worker processes of a pool extracting saves (see extract_file). Events can only be handed over to
+    a process when it starts, not with each task.
+    """
+    global worker_stop_event
+    worker_stop_event = stop_event
 
-def extract_files(campaign_folder, files, stop_event, finish_event, queue, delete=True):
+def extraction_size(file):
     """
-    Melt and extract save files (all .v3 files in a campaign folder and pre-melted save texts)
+    Size of the save to be extracted, the .v3 file or the pre-melted save.txt of a save folder. Used to extract the
+    largest saves first so that none of them is left for last.
+    """
+    address = file if ".v3" in file else os.path.join(file, "save.txt")
+    return os.path.getsize(address) if os.path.isfile(address) else 0
+
+def extract_file(campaign_folder, file, stop_event=None, delete=True, focuses=None, processes=1, melt_mode="memory", typed=False,
+                 columnar=False, codec=None, write_threads=None):
+    """
+    Melt and extract a single save file, a .v3 file or a save folder with a pre-melted save.txt. Saves are extracted by
+    a pool of worker processes, one save per task (see init_worker).
     Arguments:
         - campaign_folder (str) : Name of the target folder in the save folder
-        - files (list[str]) : List of files path to extract
-        - stop_event (multiprocessing.Event) : To communicate termination of the process with the GUI
-        - finish_event (multiprocessing.Event) : To be set if the extraction is completed without exception
-        - queue (multiprocessing.Queue) : To communicate progress with the main thread
+        - file (str) : Path of the .v3 file or save folder to extract
+        - stop_event (multiprocessing.Event) : Stops the extraction once set. Default is None (The one given to init_worker, if any)
+        - delete (bool) : Delete the .v3 file or save.txt once extracted instead of archiving it. Default is True
+        - focuses (list[str]) : Root sections to be extracted. Default is None (Extract all)
+        - processes (int) : Number of processes parsing the large sections of the save in parallel. Default is 1
+        - melt_mode (str) : How .v3 saves are melted. "memory" melts in memory through librakaly, "stream" parses the
+        melter output through a pipe while it is running (Linux only) and "file" melts into save.txt. Saves fall back to "file"
+        if the chosen mode is unavailable, and parallel parsing (processes > 1) always needs save.txt. Default is "memory"
+        - typed (bool) : Store numbers, yes/no and dates with their types instead of strings. Default is False
+        - columnar (bool) : Also store pops and buildings as NumPy columns. Default is False
+        - codec (str) : Codec of the extracted files. Default is None (storage_codec of variables.json)
+        - write_threads (int) : Number of threads writing the sections, get_write_threads(workers) for a pool of workers.
+        Default is None (get_write_threads())
+    Returns whether a save was extracted. Raises InterruptedError if stopped and RuntimeError naming the save if it failed.
+    """
+    if stop_event is None:
+        stop_event = worker_stop_event
+    try:
+        return extract_single(campaign_folder, file, stop_event, delete, focuses, processes, melt_mode, typed, columnar, codec, write_threads)
+    except (InterruptedError, RuntimeError) as e:
+        raise e
+    except Exception as e:
+        raise RuntimeError(f"Extraction of {file} failed: {str(e)}")
+
+def extract_single(campaign_folder, file, stop_event, delete, focuses, processes, melt_mode, typed, columnar, codec, write_threads):
     """
+    See extract_file
+    """
+    if stop_event is not None and stop_event.is_set():
+        raise InterruptedError("Stop event set")
+    if is_reserved_folder(file):
+        return False
     if not delete:
+        os.makedirs(f"./saves/{campaign_folder}/archive", exist_ok=True)
+    if ".v3" not in file: # check pre-extracted saves
+        if "save.txt" not in os.listdir(file):
+            return False
         try:
-            os.mkdir(f"./saves/{campaign_folder}/archive")
-        except FileExistsError:
-            pass
+            extract_save_file(f"{file}", focuses, processes, typed=typed, columnar=columnar, codec=codec, write_threads=write_threads)
+        except InterruptedError as e:
+            raise e
+        except Exception as e:
+            raise RuntimeError(f"Extraction of {file} failed: {str(e)}")
+        if delete:
+            os.remove(f"{file}/save.txt")
+            if os.path.exists(get_index_address(f"{file}/save.txt")):
+                os.remove(get_index_address(f"{file}/save.txt"))
+        elif read_index(f"{file}/save.txt") is None: # Kept saves are indexed so that missing sections can be extracted later
+            write_index(f"{file}/save.txt")
+        return True
+    folder = file.replace(".v3", "")
+
     try:
-        for file in files:
-            if stop_event.is_set():
-                raise InterruptedError("Stop event set")
-            if is_reserved_folder(file):
-                continue
-            if ".v3" not in file: # check pre-extracted saves
-                if "save.txt" in os.listdir(file):
-                    extract_save_file(f"{file}")
-                    if delete:
-                        os.remove(f"{file}/save.txt")
-                continue
-            folder = file.replace(".v3", "")
+        os.mkdir(folder)
+    except FileExistsError:
+        pass
 
-            try:
-                os.mkdir(folder)
-            except FileExistsError:
-                pass
+    melted = None
+    try:
+        if melt_mode == "memory" and processes == 1 and load_rakaly() is not None:
+            melted = t_execute(melt_buffer)(file)
+        elif melt_mode == "stream" and processes == 1 and platform.system() == "Linux":
+            melter = melt(file, stream=True)
+            melted = io.TextIOWrapper(melter.stdout, encoding="utf-8-sig")
+        else:
+            t_execute(melt)(file, f"{folder}/save.txt")
+    except NotImplementedError:
+        return False
+    except Exception as e:
+        raise RuntimeError(f"Melting of {file} failed: {str(e)}")
+    if stop_event is not None and stop_event.is_set():
+        raise InterruptedError("Stop event set")
 
-            try:
-                t_execute(melt)(file, f"{folder}/save.txt")
-            except NotImplementedError:
-                continue
-            except Exception as e:
-                raise RuntimeError("Melting failed:", e)
-            if stop_event.is_set():
-                raise InterruptedError("Stop event set")
-            
-            try:
-                extract_save_file(folder)
-            except Exception as e:
-                raise RuntimeError(f"Extraction of {file} failed: {str(e)}")
-            
-            os.remove(f"{folder}/save.txt")
-            new_name = rename_folder_to_date(folder)
-            if delete:
-                os.remove(file)
-            else:
-                new_name = f"./saves/{campaign_folder}/{new_name}.v3"
-                os.rename(file, new_name)
-                shutil.move(new_name, f"./saves/{campaign_folder}/archive/")
-            queue.put(1)
+    try:
+        extract_save_file(folder, focuses, processes, melted, typed, columnar, codec, write_threads=write_threads)
+        if isinstance(melted, io.TextIOWrapper):
+            finish_melt(melter, file)
     except Exception as e:
-        stop_event.set()
-        raise e
-    finally:
-        finish_event.set()
+        if isinstance(melted, io.TextIOWrapper): # Don't leave the melter blocked on a full pipe
+            melter.kill()
+            melter.wait()
+            melter.errors.close()
+        if isinstance(e, InterruptedError):
+            raise e
+        raise RuntimeError(f"Extraction of {file} failed: {str(e)}")
 
+    if melted is None:
+        os.remove(f"{folder}/save.txt")
+        if os.path.exists(get_index_address(f"{folder}/save.txt")):
+            os.remove(get_index_address(f"{folder}/save.txt"))
+    del melted
+    new_name = rename_folder_to_date(folder)
+    if delete:
+        os.remove(file)
+    else:
+        new_name = f"./saves/{campaign_folder}/{new_name}.v3"
+        os.rename(file, new_name)
+        shutil.move(new_name, f"./saves/{campaign_folder}/archive/")
+    return True
@@ -1,9 +1,113 @@
 """"
 Interface to Rakaly save melter. The melter is available in Windows and Linux platforms
 """
-import glob, subprocess, platform, os
+import glob, subprocess, platform, os, ctypes, warnings, tempfile
 
-def melt(address, out):
+RAKALY_LIBRARIES = {"Linux": "./bin/rakaly_linux/librakaly.so", "Windows": "./bin/rakaly_windows/rakaly.dll"}
+rakaly = None # librakaly loaded by load_rakaly
+
+def load_rakaly():
+    """
+    Load librakaly through ctypes (once per process) and declare the signatures of the functions used in melt_buffer.
+    Returns None if the library isn't available on this platform.
+    """
+    global rakaly
+    if rakaly is not None:
+        return rakaly
+    address = RAKALY_LIBRARIES.get(platform.system())
+    if address is None or not os.path.exists(address):
+        return None
+    library = ctypes.CDLL(os.path.abspath(address))
+    pointer = ctypes.c_void_p
+    signatures = {
+        "rakaly_vic3_file": ([ctypes.c_char_p, ctypes.c_size_t], pointer),
+        "rakaly_file_error": ([pointer], pointer),
+        "rakaly_file_value": ([pointer], pointer),
+        "rakaly_file_melt": ([pointer], pointer),
+        "rakaly_free_file": ([pointer], None),
+        "rakaly_melt_error": ([pointer], pointer),
+        "rakaly_melt_value": ([pointer], pointer),
+        "rakaly_melt_is_verbatim": ([pointer], ctypes.c_bool),
+        "rakaly_melt_binary_unknown_tokens": ([pointer], ctypes.c_bool),
+        "rakaly_melt_data_length": ([pointer], ctypes.c_size_t),
+        "rakaly_melt_write_data": ([pointer, ctypes.c_char_p, ctypes.c_size_t], ctypes.c_size_t),
+        "rakaly_free_melt": ([pointer], None),
+        "rakaly_error_length": ([pointer], ctypes.c_int),
+        "rakaly_error_write_data": ([pointer, ctypes.c_char_p, ctypes.c_int], ctypes.c_int),
+        "rakaly_free_error": ([pointer], None),
+    }
+    for name, (argtypes, restype) in signatures.items():
+        function = getattr(library, name)
+        function.argtypes = argtypes
+        function.restype = restype
+    rakaly = library
+    return rakaly
+
+def raise_rakaly_error(error):
+    """Raise the message of a librakaly error pointer as a ValueError and free it. Does nothing on a null pointer."""
+    if not error:
+        return
+    try:
+        length = rakaly.rakaly_error_length(error)
+        message = ctypes.create_string_buffer(length)
+        rakaly.rakaly_error_write_data(error, message, length)
+    finally:
+        rakaly.rakaly_free_error(error)
+    raise ValueError("librakaly returned an error", message.raw.decode("utf-8", errors="replace"))
+
+def melt_buffer(address):
+    """
+    Melt a save in memory through librakaly instead of the melter executable, so no save.txt is written.
+    Returns the melted plain text as bytes (a bytearray written by librakaly, so that it's held only once besides
+    librakaly's own buffer until that's freed), which ExtractorSave takes in place of a file.
+    librakaly's buffers are freed whether the save melted or not, since a worker process melts many saves.
+    """
+    if load_rakaly() is None:
+        raise NotImplementedError("librakaly is not available on this platform.")
+    with open(address, "rb") as file:
+        data = file.read()
+    file_result = rakaly.rakaly_vic3_file(data, len(data))
+    raise_rakaly_error(rakaly.rakaly_file_error(file_result))
+    save = rakaly.rakaly_file_value(file_result)
+    try:
+        melt_result = rakaly.rakaly_file_melt(save)
+        raise_rakaly_error(rakaly.rakaly_melt_error(melt_result))
+        melted = rakaly.rakaly_melt_value(melt_result)
+    finally:
+        rakaly.rakaly_free_file(save)
+    try:
+        if rakaly.rakaly_melt_binary_unknown_tokens(melted):
+            warnings.warn(f"Unable to melt all fields of {address}")
+        if rakaly.rakaly_melt_is_verbatim(melted): # Already plain text
+            return data
+        del data
+        length = rakaly.rakaly_melt_data_length(melted)
+        buffer = bytearray(length)
+        if rakaly.rakaly_melt_write_data(melted, (ctypes.c_char * length).from_buffer(buffer), length) != length:
+            raise ValueError("librakaly failed to copy data.")
+    finally:
+        rakaly.rakaly_free_melt(melted)
+    print(f"File {address} melted in memory")
+    return buffer
+
+def melt(address, out=None, stream=False):
+    """
+    Melt a save into a plain text file out with the melter executable.
+    stream (bool, optional): Instead of writing out, start the melter with its output going into a pipe and return the
+    subprocess.Popen object, whose stdout can be parsed while the melter is running. Check it with finish_melt afterwards.
+    Its stderr goes into a temporary file rather than a second pipe, which would block the melter once full of warnings
+    while stdout is still being read. Only available on Linux.
+    """
+    if stream:
+        if platform.system() != "Linux":
+            raise NotImplementedError("Streaming the melter output is only available on Linux.")
+        envariables = os.environ.copy()
+        envariables["LD_LIBRARY_PATH"] = "./bin/rakaly_linux/"
+        command = ["./bin/rakaly_linux/melter", "save", address, "/dev/stdout"]
+        errors = tempfile.TemporaryFile()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, env=envariables)
+        process.errors = errors # Read by finish_melt
+        return process
     if platform.system() == "Linux":
         envariables = os.environ.copy()
         envariables["LD_LIBRARY_PATH"] = "./bin/rakaly_linux/"
@@ -33,6 +137,21 @@ def melt(address, out):
         raise ValueError("Command failed with return code", result.returncode)    
 
 
+def finish_melt(process, address):
+    """
+    Wait for a melter started by melt(stream=True) to exit and raise if it failed.
+    """
+    process.wait()
+    with process.errors:
+        process.errors.seek(0)
+        stderr = process.errors.read().decode("utf-8", errors="replace")
+    if process.returncode == 0:
+        print(f"File {address} melted through a pipe")
+    else:
+        print(stderr)
+        print("Command failed with return code", process.returncode)
+        raise ValueError("Command failed with return code", process.returncode)
+
 def melt_multiple(num, pattern):
     """
     Used to melt multiple files with a matching pattern at once.
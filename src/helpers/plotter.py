@@ -106,7 +106,7 @@ def plot_stat(campaign_folder, mode, input_file=None, limit=10, players=True, ti
                 year, month, day = metadata["save_date"]
             except KeyError:
                 metadata = load_save(["meta_data"], save_folder, True)
-                year, month, day = metadata["meta_data"]["game_date"].split(".")[:3]
+                year, month, day = split_date(metadata["meta_data"]["game_date"])
             year_number = int(year) + (int(month) - 1) / 12 + int(day) / (365) # Simplified formula
             if year_number < start_date or year_number > end_date + 1:
                 continue
@@ -0,0 +1,399 @@
+"""
+Storage of the extracted data of a save in extracted_save: each section (a large topic or miscellaneous) is a pickle
+compressed with a codec, and extracted_save/manifest.json records how the save was extracted and stored.
+
+Codecs are written as "name" or "name-level", i.e. "zlib-1", "lzma" or "none". Saves extracted before the manifest
+recorded codecs are stored with LEGACY_CODEC.
+
+The database of a very large section (i.e. pops) can be split into shards of a fixed number of entries, stored as the
+sections {section}.0, {section}.1... next to the rest of the section. The manifest records the number of shards of each
+sharded section.
+
+The database entries of a deduplicated section are stored in blocks of consecutive keys, each block once per campaign as
+a blob in saves/{campaign_folder}/campaign_data/blobs addressed by the hash of its pickle, and the section's file only
+lists the blobs of its blocks. Consecutive saves of a campaign thus share their unchanged blocks. Blobs are never removed
+with their saves.
+"""
+import os, json, pickle, gzip, zlib, bz2, lzma, concurrent.futures, threading, hashlib, shutil
+
+# Codec name: (file extension, compression function taking the data and the level, decompression function, default level)
+CODECS = {
+    "none": (".pickle", lambda data, level: data, lambda data: data, None),
+    "gzip": (".gz", lambda data, level: gzip.compress(data, compresslevel=level), gzip.decompress, 9),
+    "zlib": (".zlib", lambda data, level: zlib.compress(data, level), zlib.decompress, 6),
+    "bz2": (".bz2", lambda data, level: bz2.compress(data, compresslevel=level), bz2.decompress, 9),
+    "lzma": (".xz", lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 6),
+}
+LEGACY_CODEC = "gzip-9"
+
+def parse_codec(codec):
+    """
+    Split a codec into its name and level, the default level of the codec if unspecified
+    """
+    name, _, level = codec.partition("-")
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec {codec}, expected one of {list(CODECS)} with an optional level, i.e. zlib-1")
+    return name, int(level) if level else CODECS[name][3]
+
+def codec_from_address(address):
+    """
+    Codec of a stored file from its extension, at its default level
+    """
+    for name, (extension, _, _, _) in CODECS.items():
+        if address.endswith(extension):
+            return name
+    raise ValueError(f"No codec stores files like {address}")
+
+def dumps(data, codec):
+    name, level = parse_codec(codec)
+    return CODECS[name][1](pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), level)
+
+def loads(data, codec):
+    return pickle.loads(CODECS[parse_codec(codec)[0]][2](data))
+
+def read_file(address, codec=None):
+    """
+    Read a stored file, with the codec given by its extension if unspecified.
+    The file is read at once and decompressed in memory, which is much faster than unpickling from a decompressing stream.
+    """
+    with open(address, "rb") as file:
+        return loads(file.read(), codec or codec_from_address(address))
+
+def write_bytes(address, data):
+    """
+    Write bytes into a file. They're written into a temporary file first so that a reader never sees a partial file.
+    """
+    temporary = f"{address}.{os.getpid()}.{threading.get_ident()}.tmp" # Also unique between the threads of SectionWriter
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, address)
+
+def write_file(address, data, codec):
+    """
+    Write data into a stored file (see write_bytes)
+    """
+    write_bytes(address, dumps(data, codec))
+
+def link_file(source, destination):
+    """
+    Hard link a stored file into another folder, or copy it where links aren't supported. Stored files are only ever
+    replaced (see write_bytes), never modified, so the linked files stay independent.
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+def read_manifest(output):
+    """
+    Read extracted_save/manifest.json of a save folder, which describes how its extracted data is stored.
+    Returns an empty dictionary for saves extracted before the manifest existed.
+    """
+    try:
+        with open(f"{output}/extracted_save/manifest.json", "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return dict()
+
+def write_manifest(output, entries):
+    """
+    Update extracted_save/manifest.json of a save folder with the given entries.
+    """
+    manifest = read_manifest(output) | entries
+    with open(f"{output}/extracted_save/manifest.json", "w") as file:
+        json.dump(manifest, file)
+
+def section_codec(manifest, section):
+    """
+    Codec a section of a save is stored with according to its manifest
+    """
+    return manifest.get("codecs", dict()).get(section, LEGACY_CODEC)
+
+def get_section_address(output, section, codec):
+    return f"{output}/extracted_save/{section}{CODECS[parse_codec(codec)[0]][0]}"
+
+def has_section(output, section, manifest=None):
+    """
+    Whether a section is stored in a save folder
+    """
+    if manifest is None:
+        manifest = read_manifest(output)
+    return os.path.exists(get_section_address(output, section, section_codec(manifest, section)))
+
+def get_blob_address(output, blob, codec):
+    """Blob of the campaign of a save folder, i.e. saves/campaign/save -> saves/campaign/campaign_data/blobs/ab/ab12...zlib"""
+    campaign_data = os.path.join(os.path.dirname(os.path.abspath(output)), "campaign_data")
+    return os.path.join(campaign_data, "blobs", blob[:2], f"{blob}{CODECS[parse_codec(codec)[0]][0]}")
+
+def deduplicate(output, section, data, codec, block_size):
+    """
+    Store the database entries of a section ({section: {"database": ...}}) as blobs of the campaign of the save folder,
+    grouping them into blocks of block_size consecutive integer keys. A blob is addressed by the hash of the pickle of its
+    block so that a block unchanged since a previous save is neither compressed nor written again.
+    Returns the data of the section's own file: the rest of the section, the blobs of its blocks and the order of the keys
+    if it can't be rebuilt from the blocks.
+    """
+    database = data[section]["database"]
+    blocks = dict() # Block number: entries, in order of first appearance
+    for key, entry in database.items():
+        block = int(key) // block_size if str(key).isdigit() else -1
+        if block not in blocks:
+            blocks[block] = dict()
+        blocks[block][key] = entry
+    name, level = parse_codec(codec)
+    refs = []
+    for entries in blocks.values():
+        block_pickle = pickle.dumps(entries, protocol=pickle.HIGHEST_PROTOCOL)
+        blob = hashlib.blake2b(block_pickle, digest_size=16).hexdigest()
+        if not os.path.exists(address := get_blob_address(output, blob, codec)):
+            os.makedirs(os.path.dirname(address), exist_ok=True)
+            write_bytes(address, CODECS[name][1](block_pickle, level))
+        refs.append([blob, codec])
+    keys = [key for entries in blocks.values() for key in entries]
+    order = None if keys == list(database) else list(database)
+    return {section: {k: v for k, v in data[section].items() if k != "database"}, "blocks": refs, "order": order}
+
+def resolve(output, section, data, threads=None):
+    """
+    Rebuild the database of a deduplicated section from the data of its own file, reading its blobs concurrently
+    """
+    addresses = [(get_blob_address(output, blob, codec), codec) for blob, codec in data["blocks"]]
+    with concurrent.futures.ThreadPoolExecutor(max(1, min(threads or os.cpu_count() or 1, len(addresses)))) as pool:
+        blocks = list(pool.map(lambda address: read_file(*address), addresses))
+    database = dict()
+    for entries in blocks:
+        database.update(entries)
+    if data["order"] is not None:
+        database = {key: database[key] for key in data["order"]}
+    data[section]["database"] = database
+    return {section: data[section]}
+
+def shard_name(section, shard):
+    return f"{section}.{shard}"
+
+def get_shards(manifest, section):
+    """
+    Number of shards of a section according to the manifest of its save, 0 if it isn't sharded
+    """
+    return manifest.get("shards", dict()).get(section, 0)
+
+def read_section(output, section, manifest=None, threads=None):
+    """
+    Read a section stored in a save folder with the codec recorded in the manifest.
+    The shards of a sharded section are read concurrently (see read_sections) and merged back into its database.
+    """
+    if manifest is None:
+        manifest = read_manifest(output)
+    codec = section_codec(manifest, section)
+    data = read_file(get_section_address(output, section, codec), codec)
+    if section in manifest.get("deduplicated", []):
+        data = resolve(output, section, data, threads)
+    if (shards := get_shards(manifest, section)) > 0:
+        database = data[section]["database"] = dict()
+        for shard in read_sections(output, [shard_name(section, i) for i in range(shards)], manifest, threads).values():
+            database.update(shard["database"])
+    return data
+
+def iter_shards(output, section, manifest=None):
+    """
+    Iterate over the database of a section stored in a save folder one shard at a time, so that the whole database is
+    never in memory. A section that isn't sharded is a single shard.
+    """
+    if manifest is None:
+        manifest = read_manifest(output)
+    if (shards := get_shards(manifest, section)) == 0:
+        yield read_section(output, section, manifest)[section]["database"]
+        return
+    for i in range(shards):
+        yield read_section(output, shard_name(section, i), manifest)["database"]
+
+def read_sections(output, sections, manifest=None, threads=None):
+    """
+    Read several sections stored in a save folder. Returns a dictionary of section name to data.
+    Sections are read concurrently on a pool of threads, since decompression releases the GIL.
+    threads (int, optional): Number of threads. Default is None (one per section, up to the number of CPUs)
+    """
+    if manifest is None:
+        manifest = read_manifest(output)
+    sections = list(sections)
+    if threads is None:
+        threads = os.cpu_count() or 1
+    threads = min(threads, len(sections))
+    if threads <= 1:
+        return {section: read_section(output, section, manifest) for section in sections}
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        return dict(zip(sections, pool.map(lambda section: read_section(output, section, manifest), sections)))
+
+def split_shards(section, data, shard_size):
+    """
+    Split the database of a section ({section: {"database": ...}}) into shards of shard_size entries.
+    Returns the files to be stored, the rest of the section first, and the number of shards. An empty database is a
+    single empty shard, since a section without shards is read as not sharded.
+    """
+    database = data[section]["database"]
+    keys = list(database)
+    files = {section: {section: {k: v for k, v in data[section].items() if k != "database"}}}
+    for shard, start in enumerate(range(0, max(len(keys), 1), shard_size)):
+        files[shard_name(section, shard)] = {"database": {key: database[key] for key in keys[start:start + shard_size]}}
+    return files, len(files) - 1
+
+def has_database(section, data):
+    return isinstance(data.get(section), dict) and isinstance(data[section].get("database"), dict)
+
+def store_section(output, section, data, codec, manifest, sharded=(), shard_size=None, deduplicated=(), block_size=None):
+    """
+    Write a single section into a save folder with a codec, removing its file previously stored with another codec
+    (see write_sections). Returns its number of shards (None if it isn't sharded) and whether it's deduplicated, to be
+    recorded in the manifest by record_sections.
+    """
+    files, shards = {section: data}, None
+    is_deduplicated = section in deduplicated and has_database(section, data)
+    if is_deduplicated:
+        files = {section: deduplicate(output, section, data, codec, block_size)}
+    elif section in sharded and has_database(section, data):
+        files, shards = split_shards(section, data, shard_size)
+    for name, file_data in files.items():
+        previous = get_section_address(output, name, section_codec(manifest, name))
+        write_file(get_section_address(output, name, codec), file_data, codec)
+        if previous != get_section_address(output, name, codec) and os.path.exists(previous):
+            os.remove(previous)
+    return shards, is_deduplicated
+
+def record_sections(output, manifest, stored, codec):
+    """
+    Record the sections written by store_section ({section: (shards, deduplicated)}) in the manifest of a save folder,
+    and remove their previous shards which weren't written again.
+    """
+    codecs = manifest.get("codecs", dict())
+    shards = manifest.get("shards", dict())
+    deduplicated_sections = [section for section in manifest.get("deduplicated", []) if section not in stored]
+    stale = []
+    for section, (section_shards, is_deduplicated) in stored.items():
+        previous_shards = shards.pop(section, 0)
+        if section_shards is not None:
+            shards[section] = section_shards
+        if is_deduplicated:
+            deduplicated_sections.append(section)
+        for name in [section] + [shard_name(section, i) for i in range(section_shards or 0)]:
+            codecs[name] = codec
+        stale += [shard_name(section, i) for i in range(section_shards or 0, previous_shards)]
+    for name in stale:
+        if os.path.exists(address := get_section_address(output, name, codecs.pop(name, LEGACY_CODEC))):
+            os.remove(address)
+    write_manifest(output, {"codecs": codecs, "shards": shards, "deduplicated": deduplicated_sections})
+
+class SectionWriter:
+    """
+    Write sections into a save folder in the background on a pool of threads (see store_section), so that the caller
+    can go on, i.e. parsing the next sections, while they're pickled and compressed. Compression releases the GIL, so
+    several sections are compressed in parallel.
+    At most pending sections wait to be written at a time, submit blocks until one of them is written.
+    The manifest is only updated by close, once every section is written.
+
+    Parameters:
+    output (str): Save folder, whose extracted_save folder exists
+    codec (str): Codec of the written files
+    sharded, shard_size, deduplicated, block_size: See write_sections
+    threads (int, optional): Number of writing threads. Default is None (One per CPU)
+    pending (int, optional): Maximum number of sections waiting to be written. Default is None (Twice the number of threads)
+    """
+    def __init__(self, output, codec, sharded=(), shard_size=None, deduplicated=(), block_size=None, threads=None, pending=None):
+        self.output = output
+        self.codec = codec
+        self.options = (sharded, shard_size, deduplicated, block_size)
+        self.manifest = read_manifest(output)
+        threads = max(1, threads or os.cpu_count() or 1)
+        self.pool = concurrent.futures.ThreadPoolExecutor(threads)
+        self.slots = threading.BoundedSemaphore(pending or 2 * threads)
+        self.futures = dict() # Section name: future of its last submitted writing
+        self.done = [] # Futures of sections submitted again
+
+    def submit(self, section, data):
+        """
+        Write a section ({section: ...}) in the background. The data must not be modified until it's written.
+        A section submitted again replaces the previous one.
+        """
+        if section in self.futures: # Written in order
+            self.futures[section].result()
+            self.done.append(self.futures[section])
+        self.slots.acquire()
+        future = self.pool.submit(store_section, self.output, section, data, self.codec, self.manifest, *self.options)
+        future.add_done_callback(lambda future: self.slots.release())
+        self.futures[section] = future
+
+    def close(self):
+        """
+        Wait for every section to be written and record them in the manifest. Raises the first error of the writing
+        threads, if any, without updating the manifest.
+        """
+        self.pool.shutdown(wait=True)
+        for future in self.done + list(self.futures.values()):
+            future.result()
+        record_sections(self.output, self.manifest, {section: future.result() for section, future in self.futures.items()}, self.codec)
+
+    def abort(self):
+        """
+        Stop writing, i.e. after the parsing failed: the sections not being written yet are dropped and the manifest isn't updated
+        """
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+def write_sections(output, sections, codec, sharded=(), shard_size=None, deduplicated=(), block_size=None, threads=None):
+    """
+    Write sections (a dictionary of section name to data) into a save folder with a codec and record it in the manifest.
+    Files of these sections previously stored with another codec, and their previous shards, are removed.
+    Sections are pickled and compressed concurrently (see SectionWriter).
+    sharded (list, optional): Sections whose database is split into shards of shard_size entries. Default is () (No sharding)
+    deduplicated (list, optional): Sections whose database entries are stored as blobs of the campaign in blocks of
+    block_size keys (see deduplicate), which takes precedence over sharding. Default is () (No deduplication)
+    threads (int, optional): Number of writing threads. Default is None (One per CPU)
+    """
+    writer = SectionWriter(output, codec, sharded, shard_size, deduplicated, block_size, threads)
+    try:
+        for section, data in sections.items():
+            writer.submit(section, data)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+def copy_sections(source, output, sections):
+    """
+    Copy sections, with their shards, from the save folder source into the save folder output (see link_file) and record
+    them in the manifest of output. The blobs of deduplicated sections are shared by the saves of a campaign.
+    Either every section is copied or none is: if a file can't be, i.e. source was removed meanwhile, the files already
+    copied are removed and the error is raised.
+    """
+    os.makedirs(f"{output}/extracted_save", exist_ok=True)
+    source_manifest = read_manifest(source)
+    manifest = read_manifest(output)
+    copied = {section: [section] + [shard_name(section, i) for i in range(get_shards(source_manifest, section))] for section in sections}
+    linked = []
+    try:
+        for names in copied.values():
+            for name in names:
+                address = get_section_address(output, name, section_codec(source_manifest, name))
+                link_file(get_section_address(source, name, section_codec(source_manifest, name)), address)
+                linked.append(address)
+    except OSError as e:
+        for address in linked:
+            os.remove(address)
+        raise e
+    codecs = manifest.get("codecs", dict())
+    shards = manifest.get("shards", dict())
+    deduplicated = [section for section in manifest.get("deduplicated", []) if section not in sections]
+    for section, names in copied.items():
+        previous_shards = shards.pop(section, 0)
+        for name in names + [shard_name(section, i) for i in range(len(names) - 1, previous_shards)]: # Remove the previous files
+            previous = get_section_address(output, name, section_codec(manifest, name))
+            if previous not in linked and os.path.exists(previous):
+                os.remove(previous)
+            codecs.pop(name, None)
+        for name in names:
+            codecs[name] = section_codec(source_manifest, name)
+        if len(names) > 1:
+            shards[section] = len(names) - 1
+        if section in source_manifest.get("deduplicated", []):
+            deduplicated.append(section)
+    write_manifest(output, {"codecs": codecs, "shards": shards, "deduplicated": deduplicated})
@@ -1,9 +1,10 @@
 """
 Whatever functions written to help the program.
 """
-import sys, os, shutil, fnmatch, pickle, gzip, glob, json, re
-from src.extractor import ExtractorCommon
-import time, functools
+import sys, os, shutil, fnmatch, pickle, glob, json, re
+from src.extractor import ExtractorCommon, ExtractorSave, VARIABLES
+from src.helpers.storage import read_manifest, read_file, read_section, read_sections, has_section
+import time, functools, hashlib, copy, concurrent.futures
 
 def t_execute(func):
     @functools.wraps(func)
@@ -18,10 +19,9 @@ def t_execute(func):
 
 def zopen(address:str):
     """
-    Opens a gzip file.
+    Opens a compressed pickle, with the codec given by its extension (see src/helpers/storage.py).
     """
-    with gzip.open(address, 'rb') as f:
-        return pickle.load(f)
+    return read_file(address)
 
 def jopen(address:str):
     """
@@ -70,7 +70,7 @@ def retrieve_from_tree(tree:dict, directory:list, null=None):
         result = retrieve_from_tree(tree, directory)  # result will be 'value'
     """
     current = tree
-    if isinstance(directory, str):
+    if not isinstance(directory, list): # A single key, i.e. an int id of a typed extraction
         directory = [directory]
     for subdir in directory:
         if not isinstance(current, dict) or subdir not in current:
@@ -78,87 +78,314 @@ def retrieve_from_tree(tree:dict, directory:list, null=None):
         current = current[subdir]
     return current
 
+def merge_definitions(defs, data, depth_add=0):
+    """
+    Merge the content of a definition file into defs. See load_def_multiple for depth_add
+    """
+    if depth_add == 0:
+        defs.update(data)
+    else:
+        for key, value in data.items():
+            if isinstance(value, dict) and key in defs:
+                defs[key].update(value)
+            else:
+                defs[key] = value
+    return defs
+
+def get_definitions_stamp(addresses):
+    """
+    Name, modification time and size of each definition file, to tell whether a cached parse is still valid
+    """
+    return [[os.path.basename(address), os.path.getmtime(address), os.path.getsize(address)] for address in addresses]
+
+DEFINITIONS_FORMAT = 1 # To be increased whenever cached definitions change shape without their parsing code changing
+
+def get_parser_version():
+    """
+    Version of the parser of the cached definitions: DEFINITIONS_FORMAT and a hash of the code parsing and merging them
+    (src/extractor.py, this file and src/helpers/convert_localization.py), so that no change in it keeps serving stale entries
+    """
+    digest = hashlib.sha1(str(DEFINITIONS_FORMAT).encode())
+    for address in ["./src/extractor.py", "./src/helpers/utility.py", "./src/helpers/convert_localization.py"]:
+        with open(address, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+PARSER_VERSION = get_parser_version()
+
+def get_definitions_cache_address(key):
+    return f"{VARIABLES['definitions_cache']}/{hashlib.sha1(repr((PARSER_VERSION, key)).encode()).hexdigest()}.pickle"
+
+def read_cached_definitions(addresses, key):
+    """
+    Definitions of the on-disk cache entry of key (see load_definitions), or None if it's missing or outdated
+    """
+    try:
+        with open(get_definitions_cache_address(key), "rb") as file:
+            cached = pickle.load(file)
+        if cached["key"] == key and cached["version"] == PARSER_VERSION and cached["stamp"] == get_definitions_stamp(addresses):
+            return cached["data"]
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError, KeyError):
+        pass
+    return None
+
+def parse_definition_file(address):
+    """
+    Parse a single definition file. Used by the worker processes of warm_definitions.
+    """
+    return ExtractorCommon(address).data
+
+def load_definitions(addresses, key, depth_add=0, parsed=None):
+    """
+    Parse and merge definition files in order, through an on-disk cache in VARIABLES["definitions_cache"].
+    key (tuple): Identifies the cached entry, i.e. the folder, the mode and depth_add. The entry is parsed again once any
+    of its files is added, removed or modified, or once the parser changes (see get_parser_version).
+    parsed (dict, optional): Files already parsed (see warm_definitions), by address
+    """
+    if (defs := read_cached_definitions(addresses, key)) is not None:
+        return defs
+    stamp = get_definitions_stamp(addresses)
+    defs = dict()
+    for address in addresses:
+        if parsed is not None and address in parsed: # Shared between entries, copied as merging with depth_add modifies the files' trees
+            data = copy.deepcopy(parsed[address]) if depth_add > 0 else parsed[address]
+        else:
+            data = parse_definition_file(address)
+        merge_definitions(defs, data, depth_add)
+    write_cached_definitions(stamp, key, defs)
+    return defs
+
+def write_cached_definitions(stamp, key, data):
+    """
+    Write an entry of the on-disk definitions cache, with the stamp of the files it was parsed from (see get_definitions_stamp)
+    """
+    cache_address = get_definitions_cache_address(key)
+    os.makedirs(VARIABLES["definitions_cache"], exist_ok=True)
+    with open(f"{cache_address}.{os.getpid()}", "wb") as file: # Other processes may be reading the entry
+        pickle.dump({"key": key, "version": PARSER_VERSION, "stamp": stamp, "data": data}, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{cache_address}.{os.getpid()}", cache_address)
+
+class FrozenDict(dict):
+    """
+    Read-only dictionary of the definitions registry (see registered_definitions), shared by every checker and save
+    """
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Definitions are shared and read-only, copy them (i.e. dict(definitions)) before modifying")
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+def freeze(tree):
+    """
+    Read-only copy of a definition tree: dictionaries become FrozenDict and lists become tuples
+    """
+    if isinstance(tree, dict):
+        return FrozenDict({key: freeze(value) for key, value in tree.items()})
+    if isinstance(tree, list):
+        return tuple([freeze(value) for value in tree])
+    return tree
+
+DEFINITIONS = dict() # Definitions parsed in this process, see registered_definitions
+DEFINITIONS_STATS = {"hits": 0, "misses": 0}
+
+def registered_definitions(key, load):
+    """
+    Definitions identified by key from the process-wide registry, loaded by calling load() and frozen on the first request only.
+    """
+    if key in DEFINITIONS:
+        DEFINITIONS_STATS["hits"] += 1
+    else:
+        DEFINITIONS_STATS["misses"] += 1
+        DEFINITIONS[key] = freeze(load())
+    return DEFINITIONS[key]
+
+def get_definitions_stats():
+    """
+    Number of requests served by the definitions registry (hits), the number of parsed definitions (misses) and the
+    number of registered definitions
+    """
+    return DEFINITIONS_STATS | {"registered": len(DEFINITIONS)}
+
+def clear_definitions():
+    """
+    Empty the definitions registry, i.e. after changing the game or mod directories
+    """
+    DEFINITIONS.clear()
+    DEFINITIONS_STATS.update({"hits": 0, "misses": 0})
+
 def load_def(address, mode="Common Directory"):
     """
-    Load a define (content) script
+    Load a define (content) script. The definitions are read-only and shared within the process (see registered_definitions)
     """
     user_variables = jopen("./user_variables.json")
     address = user_variables[mode] + "/" + address
-    data = ExtractorCommon(address)
-    data.unquote()
-    data = data.data
-    return data
+    return registered_definitions(("file", os.path.abspath(address), mode),
+                                  lambda: load_definitions([address], (os.path.abspath(address), mode)))
 
 def load_def_multiple(folder, mode="Common Directory", depth_add=0):
     """
     Load a define (content) script from the vanilla folder, and then its mod counterpart if exists.
     depth_add (int): The maximum depth the content dict to have the subsequent files' dict's content
     added inside instead of completely clearing the existing content
+    Each folder is cached on disk separately (see load_definitions). The definitions are read-only and shared within the
+    process (see registered_definitions)
     """
     user_variables = jopen("./user_variables.json")
-    def_folder = user_variables[mode] + "/" + folder
-    defs = dict()
-    for address in glob.glob(f"{def_folder}/*.txt"):
-        data = ExtractorCommon(address)
-        data.unquote()
-        data = data.data
-        if depth_add == 0:
-            defs.update(data)
-        else:
-            for key, value in data.items():
-                if isinstance(value, dict) and key in defs:
-                    defs[key].update(value)
-                else:
-                    defs[key] = value
+    key = get_def_key(folder, mode, depth_add, user_variables)
+    return registered_definitions(key, lambda: parse_def_multiple(folder, mode, depth_add, user_variables))
+
+def get_def_key(folder, mode, depth_add, user_variables):
+    """
+    Key of the definitions of load_def_multiple in the registry
+    """
+    return ("folder", os.path.abspath(user_variables[mode] + "/" + folder), mode, user_variables["Selected Mod"], depth_add)
 
+def get_def_sources(folder, mode, depth_add, user_variables):
+    """
+    Files and disk cache keys of the vanilla folder of load_def_multiple, and then of its mod counterpart if exists
+    """
+    def_folder = user_variables[mode] + "/" + folder
+    sources = [[glob.glob(f"{def_folder}/*.txt"), (os.path.abspath(def_folder), mode, depth_add)]]
     if user_variables["Selected Mod"] and os.path.isdir(user_variables["Selected Mod"] + "//common//" + folder):
         """
         FIXME Replace //common// with mode and properly implement depth_add
         """
-        for address in glob.glob(user_variables["Selected Mod"] + "//common//" + folder + "//*.txt"):
-            data = ExtractorCommon(address)
-            data.unquote()
-            data = data.data
-            if depth_add == 0:
-                defs.update(data)
-            else:
-                for key, value in data.items():
-                    if isinstance(value, dict) and key in defs:
-                        defs[key].update(value)
-                    else:
-                        defs[key] = value
+        mod_folder = user_variables["Selected Mod"] + "//common//" + folder
+        sources.append([glob.glob(mod_folder + "//*.txt"), (os.path.abspath(mod_folder), "Selected Mod", depth_add)])
+    return sources
 
+def parse_def_multiple(folder, mode, depth_add, user_variables, parsed=None):
+    """
+    Load the definitions of load_def_multiple outside of the registry
+    """
+    defs = dict()
+    for addresses, key in get_def_sources(folder, mode, depth_add, user_variables):
+        merge_definitions(defs, load_definitions(addresses, key, depth_add, parsed), depth_add)
     return defs
 
+def warm_definitions(folders, mode="Common Directory", processes=None):
+    """
+    Register the definitions of several folders of load_def_multiple at once, parsing every file of the folders
+    missing from the disk cache (or outdated) in parallel worker processes. Results are merged the same way as load_def_multiple.
+    folders (list): Folder names, or [folder, depth_add] pairs
+    processes (int, optional): Number of worker processes. Default is None (The number of CPUs)
+    """
+    user_variables = jopen("./user_variables.json")
+    folders = [[folder, 0] if isinstance(folder, str) else list(folder) for folder in folders]
+    stale = dict() # Files of the cache entries to be rebuilt, ordered
+    for folder, depth_add in folders:
+        for addresses, key in get_def_sources(folder, mode, depth_add, user_variables):
+            if read_cached_definitions(addresses, key) is None:
+                stale.update({address: None for address in addresses})
+    stale = list(stale)
+    parsed = dict()
+    if len(stale) > 1 and processes != 1:
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            parsed = dict(zip(stale, pool.map(parse_definition_file, stale, chunksize=max(1, len(stale) // 64))))
+    for folder, depth_add in folders:
+        registered_definitions(get_def_key(folder, mode, depth_add, user_variables), lambda: parse_def_multiple(folder, mode, depth_add, user_variables, parsed))
+    return get_definitions_stats()
+
+
+class LazySave(dict):
+    """
+    Save data whose sections stored in extracted_save are only read when first accessed (see load_save).
+    Only the sections read so far are iterated over, and release() drops them until they are accessed again.
+    """
+    def __init__(self, address, manifest):
+        super().__init__()
+        self.address = address
+        self.manifest = manifest
+        self.deferred = set()
+
+    def defer(self, topic):
+        self.deferred.add(topic)
+
+    def __missing__(self, topic):
+        if topic not in self.deferred:
+            raise KeyError(topic)
+        t0 = time.time()
+        self[topic] = read_section(self.address, topic, self.manifest)[topic]
+        print(f"Finished loading {topic} from {self.address} in {time.time() - t0} seconds")
+        return self[topic]
+
+    def __contains__(self, topic):
+        return super().__contains__(topic) or topic in self.deferred
+
+    def get(self, topic, default=None):
+        return self[topic] if topic in self else default
+
+    def load(self, topics, threads=None):
+        """
+        Read the deferred sections among topics that aren't loaded yet, concurrently (see read_sections)
+        threads (int, optional): Number of threads. Default is None (load_threads of variables.json)
+        """
+        topics = [topic for topic in topics if topic in self.deferred and not dict.__contains__(self, topic)]
+        if len(topics) == 0:
+            return
+        threads = VARIABLES["load_threads"] if threads is None else threads
+        t0 = time.time()
+        for topic, data in read_sections(self.address, topics, self.manifest, threads).items():
+            self[topic] = data[topic]
+        print(f"Finished loading {topics} from {self.address} in {time.time() - t0} seconds")
+
+    def release(self, topics):
+        """
+        Drop loaded sections from memory. They are read again if accessed later.
+        """
+        for topic in topics:
+            if topic in self.deferred:
+                self.pop(topic, None)
 
-def load_save(topics:list, address:str):
+def load_save(topics:list, address:str, lazy=False, threads=None):
     """
     Load a subset of information from a save file or pre-extracted data files
 
     Returns a dictionary of data according to the specified topic
     Elements of topics that aren't strings are ignored.
+    lazy (bool, optional): Return a LazySave, reading the extracted sections on first access. Default is False
+    threads (int, optional): Number of threads reading the extracted sections concurrently. Default is None (load_threads
+    of variables.json, or one per section up to the number of CPUs if null)
     """
     if len(topics) == 0: #
-        return dict()
+        return LazySave(address, dict()) if lazy else dict()
     topics_original = topics.copy()
     topics = topics.copy()
     t0 = time.time()
-    data_output = dict()
     if "extracted_save" not in os.listdir(address):
         os.mkdir(f"{address}/extracted_save")
-    if "miscellaneous.gz" in os.listdir(f"{address}/extracted_save"):
-        miscellaneous = zopen(f"{address}/extracted_save/miscellaneous.gz")
-    else:
-        miscellaneous = dict()
+    manifest = read_manifest(address)
+    data_output = LazySave(address, manifest) if lazy else dict()
+    miscellaneous = None
+    stored = []
     for topic in topics.copy():
-        if f"{topic}.gz" in os.listdir(f"{address}/extracted_save"):
-            data_output[topic] = zopen(f"{address}/extracted_save/{topic}.gz")[topic]
+        if not isinstance(topic, str): # results of resolve compatibility of unimplemented variables
             topics.pop(topics.index(topic))
-        elif topic in miscellaneous:
-            data_output[topic] = miscellaneous[topic]
+            continue
+        if has_section(address, topic, manifest):
+            stored.append(topic)
             topics.pop(topics.index(topic))
-        elif not isinstance(topic, str): # results of resolve compatibility of unimplemented variables
+            continue
+        if miscellaneous is None: # Saves extracted before each root section was stored on its own
+            miscellaneous = read_section(address, "miscellaneous", manifest) if has_section(address, "miscellaneous", manifest) else dict()
+        if topic in miscellaneous:
+            data_output[topic] = miscellaneous[topic]
             topics.pop(topics.index(topic))
+    if lazy:
+        for topic in stored:
+            data_output.defer(topic)
+    else:
+        threads = VARIABLES["load_threads"] if threads is None else threads
+        data_output.update({topic: data[topic] for topic, data in read_sections(address, stored, manifest, threads).items()})
+    if len(topics) > 0 and os.path.exists(f"{address}/save.txt"): # Extract missing topics from the kept melted save
+        typed = manifest.get("typed", False) # Keep the extracted data consistent
+        data = ExtractorSave(f"{address}/save.txt", focuses=topics, typed=typed)
+        data.write(address, sections=list(data.data), separate=True)
+        for topic in topics.copy():
+            if topic in data.data:
+                data_output[topic] = data.data[topic]
+                topics.pop(topics.index(topic))
     if len(topics) > 0:
         raise FileNotFoundError(f"Failed to load {topics} from {address}.")
     print(f"Finished loading {topics_original} from {address} in {time.time() - t0} seconds")
@@ -193,23 +420,26 @@ def date_to_day(date:list):
             def_month[i] += 1
     return def_month[month] + day
 
+def split_date(date):
+    """
+    Split a date of a save, either a string (i.e. 1836.1.1.18) or a tuple of a typed extraction (i.e. (1836, 1, 1, 18)),
+    into a list of strings [year, month, day]
+    """
+    if isinstance(date, str):
+        return date.split(".")[:3]
+    return [str(i) for i in date][:3]
+
 def get_duration(this_date, start_date, end_date=None):
     """
     Get duration since start date (if end_date isn't provided) and the total duration and the fraction of time since start_date
     Doesn't exactly follow the calendar format so subject to ~1% inaccuracy
-    This function operates date in list format [year, month, day], but can and will convert str date to that format.
-    """
-    if isinstance(this_date, str):
-        this_date = [i for i in this_date.split(".")][:3]
-    this_date = [int(i) for i in this_date]
-    if isinstance(start_date, str):
-        start_date = [i for i in start_date.split(".")][:3]
-    start_date = [int(i) for i in start_date]
+    This function operates date in list format [year, month, day], but can and will convert str and tuple dates to that format.
+    """
+    this_date = [int(i) for i in split_date(this_date)]
+    start_date = [int(i) for i in split_date(start_date)]
     duration_from_start = (this_date[0] - start_date[0]) + (date_to_day(this_date) - date_to_day(start_date)) / 365.2422
     if end_date is not None:
-        if isinstance(end_date, str):
-            end_date = [i for i in end_date.split(".")][:3]
-        end_date = [int(i) for i in end_date]
+        end_date = [int(i) for i in split_date(end_date)]
         total_duration = (end_date[0] - start_date[0]) + (date_to_day(end_date) - date_to_day(start_date)) / 365.2422
         return duration_from_start, total_duration, duration_from_start / total_duration
     else:
@@ -0,0 +1,6 @@
+import os, sys
+
+# The modules read ./src/variables.json and the saves relative to the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
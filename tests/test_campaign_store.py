@@ -0,0 +1,37 @@
+"""
+Filling the campaign store with the extracted saves of a campaign (see src/helpers/campaign_store.py)
+"""
+import os
+import pytest
+from src.extractor import ExtractorSave
+from src.helpers.campaign_store import update_store, get_history
+
+SAVE = """meta_data={{ version="1.9" game_date={year}.1.1.1 }}
+country_manager={{ database={{ 1={{ definition="GBR" infamy={infamy} }} 2=none }} }}
+states={{ database={{ 1={{ country=1 arable_land=20 }} }} }}
+pops={{ database={{ 1={{ type=laborers workforce=100 dependents=50 location=1 workplace=1 }} }} }}
+building_manager={{ database={{ 1={{ building=building_farm state=1 levels=2 }} }} }}
+"""
+
+@pytest.fixture
+def campaign(tmp_path, monkeypatch):
+    """Campaign folder with two extracted saves and a failed one, the store being relative to the repository root"""
+    monkeypatch.chdir(tmp_path)
+    for year, infamy in [(1850, 5.5), (1851, 7)]:
+        os.makedirs(f"saves/campaign/campaign_{year}_1_1")
+        ExtractorSave(SAVE.format(year=year, infamy=infamy).encode()).write(f"saves/campaign/campaign_{year}_1_1", separate=True)
+    os.makedirs("saves/campaign/autosave/extracted_save")
+    return "campaign"
+
+def test_update_store(campaign):
+    store = update_store(campaign)
+    assert get_history(store, "countries", "infamy", 1) == [("1850-01-01", 5.5), ("1851-01-01", 7.0)]
+    assert get_history(store, "countries", "population", 1) == [("1850-01-01", 150), ("1851-01-01", 150)]
+    assert get_history(store, "buildings", "workforce", 1) == [("1850-01-01", 100), ("1851-01-01", 100)]
+    assert [row[0] for row in store.execute("SELECT save_date FROM saves ORDER BY save_date")] == ["1850-01-01", "1851-01-01"]
+    store.close()
+    os.makedirs("saves/campaign/campaign_1852_1_1")
+    ExtractorSave(SAVE.format(year=1852, infamy=9).encode()).write("saves/campaign/campaign_1852_1_1", separate=True)
+    store = update_store(campaign) # Only the new save
+    assert get_history(store, "countries", "infamy", 1)[-1] == ("1852-01-01", 9.0)
+    store.close()
@@ -0,0 +1,96 @@
+"""
+Checkers sharing the loaded save data of one SaveManager, on a small synthetic save and game definitions
+"""
+import csv
+import pytest
+from src.extractor import ExtractorSave
+from src.checkers.manager import SaveManager
+from src.checkers.check_innovation import CheckInnovation
+from src.checkers.check_prestige import CheckPrestige
+from src.helpers import utility
+
+# Country 2 is a puppet of country 1 and has an army, country 3 is independent
+SAVE = """meta_data={
+    version="1.9"
+    game_date=1850.3.14.6
+}
+player_manager={ database={ 0={ country=1 } } }
+country_manager={
+    database={
+        1={ definition="GBR" ruler=1 states={ 1 } }
+        2={ definition="IRE" ruler=2 states={ 2 } }
+        3={ definition="FRA" ruler=3 states={ 3 } }
+    }
+}
+states={ database={ 1={ country=1 } 2={ country=2 } 3={ country=3 } } }
+pacts={ database={ 1={ action=puppet targets={ first=1 second=2 } } } }
+new_combat_unit_manager={
+    database={
+        1={ country=2 formation=1 type=combat_unit_type_line_infantry current_manpower=1000 current_veterancy_level=0 }
+    }
+}
+military_formation_manager={ database={ 1={ name="Army" } } }
+pops={ database={ 1={ type=laborers workforce=100 location=1 } } }
+building_manager={ database={ 1={ building=building_barracks state=1 levels=1 } } }
+companies={ database={ } }
+technology={ database={ } }
+character_manager={ database={ } }
+interest_groups={ database={ } }
+power_bloc_manager={ database={ } }
+institutions={ database={ } }
+"""
+
+DEFINITIONS = {
+    "defines/00_defines.txt": """NCountry = {
+        COUNTRY_TIER_HEGEMONY_PRESTIGE = 50 COUNTRY_TIER_EMPIRE_PRESTIGE = 40 COUNTRY_TIER_KINGDOM_PRESTIGE = 30
+        COUNTRY_TIER_GRAND_PRINCIPALITY_PRESTIGE = 20 COUNTRY_TIER_PRINCIPALITY_PRESTIGE = 10 COUNTRY_TIER_CITY_STATE_PRESTIGE = 5
+        PRESTIGE_FROM_COUNTRY_GDP_DIVISOR = 1000000 PRESTIGE_FROM_COUNTRY_GDP = 10
+        PRESTIGE_FROM_SUBJECT_GDP = 5 PRESTIGE_FROM_SUBJECT_ARMY_POWER_PROJECTION = 0.5 PRESTIGE_FROM_SUBJECT_NAVY_POWER_PROJECTION = 0.5
+        PRESTIGE_FROM_ARMY_POWER_PROJECTION = 1 PRESTIGE_FROM_NAVY_POWER_PROJECTION = 1
+        POWER_PROJECTION_DIVISOR = 100 MIN_SPOT_PRESTIGE_AWARD = 3
+    }""",
+    "static_modifiers/00_static_modifiers.txt": """base_values = { country_weekly_innovation_add = 1 }
+    country_literacy_rate = { country_weekly_innovation_add = 10 country_weekly_innovation_max_add = 50 }""",
+    "combat_unit_types/00_combat_unit_types.txt": """combat_unit_type_line_infantry = {
+        group = combat_unit_group_infantry
+        battle_modifier = { unit_offense_add = 20 unit_defense_add = 30 }
+    }""",
+    "combat_unit_groups/00_combat_unit_groups.txt": "combat_unit_group_infantry = { type = army }",
+    "combat_unit_experience_levels/00_experience_levels.txt": "experience_level_0 = { level = 0 }",
+    "subject_types/00_subject_types.txt": "subject_type_puppet = { diplomatic_action = puppet }",
+}
+
+@pytest.fixture
+def game(tmp_path, monkeypatch):
+    """Game definitions read by the checkers, in a common directory of their own"""
+    common = tmp_path / "common"
+    for folder in CheckPrestige.definitions + CheckInnovation.definitions:
+        (common / (folder if isinstance(folder, str) else folder[0])).mkdir(parents=True, exist_ok=True)
+    for address, text in DEFINITIONS.items():
+        (common / address).write_text(text)
+    user_variables = {"Common Directory": str(common), "Selected Mod": ""}
+    jopen = utility.jopen
+    monkeypatch.setattr(utility, "jopen", lambda address: user_variables if address == "./user_variables.json" else jopen(address))
+    monkeypatch.setitem(utility.VARIABLES, "definitions_cache", str(tmp_path / "cache"))
+
+def check(tmp_path, name, checks):
+    """Extract SAVE into a save folder, with the outputs of the checkers it depends on, and run checks on it"""
+    folder = tmp_path / name
+    (folder / "data").mkdir(parents=True)
+    ExtractorSave(SAVE.encode(), typed=True).write(str(folder), separate=True)
+    (folder / "data" / "finance.csv").write_text("id,GDP\n1,2000000\n2,1000000\n3,3000000\n")
+    (folder / "data" / "demographics.csv").write_text("id,literacy\n1,0.5\n2,0.2\n3,0.4\n")
+    save = SaveManager(str(folder), checks, localization={})
+    save.start_checking()
+    with open(folder / "data" / "prestige.csv") as file:
+        return {row["tag"]: row for row in csv.DictReader(file)}
+
+def test_prestige_after_innovation(tmp_path, game):
+    alone = check(tmp_path, "alone", [CheckPrestige()])
+    shared = check(tmp_path, "shared", [CheckInnovation(), CheckPrestige()])
+    assert (tmp_path / "shared" / "data" / "innovation.csv").exists()
+    subject_columns = ["subject army projection", "subject navy projection", "subject gdp prestige"]
+    assert float(alone["GBR"]["subject army projection"]) == 1000 * (20 + 30) / 2 / 100 * 0.5 # Manpower * average of offense and defense / divisor
+    assert float(alone["GBR"]["subject gdp prestige"]) == 10 * 5 / 10
+    assert [shared["GBR"][column] for column in subject_columns] == [alone["GBR"][column] for column in subject_columns]
+    assert shared["GBR"]["total"] == alone["GBR"]["total"]
@@ -0,0 +1,170 @@
+"""
+Columnar forms of the pops and buildings databases (see src/helpers/columnar.py), compared with the same aggregates
+computed on the databases, whole and split into shards
+"""
+import random
+import numpy as np
+import pytest
+from src.helpers.columnar import pops_to_columns, buildings_to_columns, concat_columns, load_columns, group_sum, \
+    workforce_by_workplace, type_mask, state_countries
+from src.helpers.storage import write_sections
+
+POP_TYPES = ["laborers", "farmers", "clerks", "aristocrats"]
+
+def make_pops(count, seed=0):
+    """Pops with string values as extracted, some dead ("none") and some unemployed (no workplace)"""
+    rng = random.Random(seed)
+    pops = dict()
+    for pop_id in range(count):
+        if rng.random() < 0.1:
+            pops[str(pop_id)] = "none"
+            continue
+        pop = {"type": rng.choice(POP_TYPES), "workforce": str(rng.randint(0, 5000)), "location": str(rng.randint(0, 9))}
+        if rng.random() < 0.7:
+            pop["workplace"] = str(rng.randint(0, 19))
+        pops[str(pop_id)] = pop
+    return pops
+
+def split(database, size):
+    keys = list(database)
+    return [{key: database[key] for key in keys[start:start + size]} for start in range(0, len(keys), size)]
+
+def stored_columns(tmp_path, topic, database, shard_size):
+    folder = tmp_path / "save"
+    (folder / "extracted_save").mkdir(parents=True)
+    write_sections(str(folder), {topic: {topic: {"database": database}}}, "zlib-1", sharded=[topic], shard_size=shard_size)
+    return load_columns(str(folder), topic)
+
+def pops_workforce_by_workplace(pops):
+    workforce = dict()
+    for pop in pops.values():
+        if isinstance(pop, dict) and "workplace" in pop:
+            workforce[int(pop["workplace"])] = workforce.get(int(pop["workplace"]), 0) + int(pop["workforce"])
+    return workforce
+
+def pops_by_type(pops):
+    return {pop_id: pop["type"] for pop_id, pop in pops.items() if isinstance(pop, dict)}
+
+def check_pops(columns, pops):
+    alive = {pop_id: pop for pop_id, pop in pops.items() if isinstance(pop, dict)}
+    assert columns["id"].tolist() == [int(pop_id) for pop_id in alive]
+    assert columns["type_names"][columns["type"]].tolist() == list(pops_by_type(pops).values())
+    assert columns["workplace"].tolist() == [int(pop.get("workplace", -1)) for pop in alive.values()]
+    assert workforce_by_workplace(columns) == pops_workforce_by_workplace(pops)
+    locations, workforce = group_sum(columns["location"], columns["workforce"])
+    expected = dict()
+    for pop in alive.values():
+        location = int(pop.get("location", -1)) # Missing ids are -1
+        expected[location] = expected.get(location, 0) + int(pop["workforce"])
+    assert dict(zip(locations.tolist(), workforce.astype(np.int64).tolist())) == expected
+    for pop_type in POP_TYPES:
+        assert columns["id"][type_mask(columns, pop_type)].tolist() == [int(i) for i, t in pops_by_type(pops).items() if t == pop_type]
+
+def test_pops_columns():
+    pops = make_pops(200)
+    check_pops(pops_to_columns(pops), pops)
+
+@pytest.mark.parametrize("size", [1, 7, 50, 500])
+def test_pops_columns_from_shards(size):
+    pops = make_pops(200)
+    columns = concat_columns([pops_to_columns(shard) for shard in split(pops, size)])
+    check_pops(columns, pops)
+    whole = pops_to_columns(pops)
+    assert sorted(columns) == sorted(whole)
+    for key in whole:
+        assert np.array_equal(columns[key], whole[key]), key
+
+def test_pops_shard_with_other_types():
+    """Shards knowing only some of the pop types are encoded again with the types of every shard"""
+    pops = {"0": {"type": "farmers", "workforce": "10"}, "1": {"type": "clerks", "workforce": "20", "workplace": "3"},
+            "2": "none", "3": {"type": "aristocrats", "workforce": "30", "workplace": "3"}}
+    columns = concat_columns([pops_to_columns(shard) for shard in split(pops, 1)])
+    check_pops(columns, pops)
+    assert columns["type_names"].tolist() == ["aristocrats", "clerks", "farmers"]
+
+def test_pops_stored_shards(tmp_path):
+    pops = make_pops(300, seed=1)
+    check_pops(stored_columns(tmp_path, "pops", pops, 64), pops)
+
+BUILDING_TYPES = ["building_university", "building_farm", "building_barracks"]
+PRODUCTION_METHODS = ["pm_basic", "pm_advanced", "pm_automated", "pm_free"]
+GOODS = 5
+STATES = {str(state): {"country": str(state % 3)} for state in range(6)}
+
+def make_buildings(count, seed=0):
+    """Buildings with string values as extracted, some removed ("none"), dead, without production methods or output"""
+    rng = random.Random(seed)
+    buildings = dict()
+    for building_id in range(count):
+        if rng.random() < 0.1:
+            buildings[str(building_id)] = "none"
+            continue
+        building = {"building": rng.choice(BUILDING_TYPES), "state": rng.choice(list(STATES)), "levels": str(rng.randint(1, 5))}
+        if rng.random() < 0.8:
+            building["production_methods"] = {"value": rng.sample(PRODUCTION_METHODS, rng.randint(0, 3))}
+        if rng.random() < 0.7:
+            building["output_goods"] = {"goods": {str(goods): {"value": str(rng.randint(1, 100) / 4)} for goods in rng.sample(range(GOODS), rng.randint(1, 3))}}
+        if rng.random() < 0.1:
+            building["dead"] = "yes"
+        buildings[str(building_id)] = building
+    return buildings
+
+def goods_by_country(buildings):
+    """Output of the living buildings by (country, goods), as in CheckPrestige"""
+    output = dict()
+    for building in buildings.values():
+        if not isinstance(building, dict) or building.get("dead") == "yes":
+            continue
+        for goods, value in building.get("output_goods", dict()).get("goods", dict()).items():
+            key = (int(STATES[building["state"]]["country"]), int(goods))
+            output[key] = output.get(key, 0) + float(value["value"])
+    return output
+
+def check_buildings(columns, buildings):
+    alive = {building_id: building for building_id, building in buildings.items() if isinstance(building, dict)}
+    assert columns["id"].tolist() == [int(building_id) for building_id in alive]
+    assert columns["building_names"][columns["building"]].tolist() == [building["building"] for building in alive.values()]
+    assert columns["dead"].tolist() == [building.get("dead") == "yes" for building in alive.values()]
+    offsets, names = columns["production_methods_offsets"], columns["production_method_names"]
+    assert [names[columns["production_methods"][offsets[i]:offsets[i + 1]]].tolist() for i in range(len(alive))] == \
+        [building.get("production_methods", {"value": []})["value"] for building in alive.values()]
+    rows = columns["goods_row"]
+    assert sorted(zip(columns["id"][rows].tolist(), columns["goods_index"].tolist(), columns["goods_value"].tolist())) == \
+        sorted((int(building_id), int(goods), float(value["value"])) for building_id, building in alive.items()
+               for goods, value in building.get("output_goods", dict()).get("goods", dict()).items())
+    living = ~columns["dead"][rows]
+    countries = state_countries(columns["state"][rows][living], STATES)
+    pairs, output = group_sum(countries * GOODS + columns["goods_index"][living], columns["goods_value"][living])
+    assert {divmod(pair, GOODS): value for pair, value in zip(pairs.tolist(), output.tolist())} == pytest.approx(goods_by_country(buildings))
+    universities = type_mask(columns, "building_university", column="building")
+    assert columns["id"][universities].tolist() == [int(i) for i, b in alive.items() if b["building"] == "building_university"]
+
+def test_buildings_columns():
+    buildings = make_buildings(200)
+    check_buildings(buildings_to_columns(buildings), buildings)
+
+@pytest.mark.parametrize("size", [1, 7, 50, 500])
+def test_buildings_columns_from_shards(size):
+    buildings = make_buildings(200)
+    columns = concat_columns([buildings_to_columns(shard) for shard in split(buildings, size)])
+    check_buildings(columns, buildings)
+    whole = buildings_to_columns(buildings)
+    assert sorted(columns) == sorted(whole)
+    for key in whole:
+        assert np.array_equal(columns[key], whole[key], equal_nan=whole[key].dtype.kind == "f"), key
+
+def test_buildings_shard_without_production_methods():
+    """Shards without production methods nor output goods, shifting the offsets and rows of the next ones"""
+    buildings = {"0": {"building": "building_farm", "state": "1"}, "1": "none",
+                 "2": {"building": "building_university", "state": "2", "production_methods": {"value": ["pm_free", "pm_basic"]},
+                       "output_goods": {"goods": {"3": {"value": "2.5"}}}},
+                 "3": {"building": "building_farm", "state": "3", "production_methods": {"value": ["pm_basic"]},
+                       "output_goods": {"goods": {"0": {"value": "1"}, "4": {"value": "3"}}}}}
+    columns = concat_columns([buildings_to_columns(shard) for shard in split(buildings, 2)])
+    check_buildings(columns, buildings)
+    assert columns["production_methods_offsets"].tolist() == [0, 0, 2, 3]
+    assert columns["goods_row"].tolist() == [1, 2, 2]
+
+def test_buildings_stored_shards(tmp_path):
+    buildings = make_buildings(300, seed=1)
+    check_buildings(stored_columns(tmp_path, "building_manager", buildings, 64), buildings)
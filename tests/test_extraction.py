@@ -0,0 +1,58 @@
+"""
+Extraction of the pre-melted saves of a campaign, reusing the sections unchanged since another save (see extract_save_file)
+"""
+import os
+from src.extractor import ExtractorSave, get_index_address
+from src.helpers.extraction import extract_save_file
+from src.helpers.storage import read_manifest, get_section_address, section_codec
+from src.helpers.utility import load_save
+
+SAVE = """meta_data={{
+    version="1.9"
+    game_date={date}
+}}
+states={{ database={{ 1={{ country=1 }} 2={{ country=2 }} }} }}
+pops={{ database={{ 1={{ type=laborers workforce={workforce} location=1 }} }} }}
+pacts={{ database={{ 1={{ action=puppet targets={{ first=1 second=2 }} }} }} }}
+"""
+
+def make_save(campaign, name, date, workforce):
+    """Save folder with a pre-melted save.txt, as left by the melter"""
+    folder = campaign / name
+    folder.mkdir(parents=True)
+    (folder / "save.txt").write_text(SAVE.format(date=date, workforce=workforce))
+    return str(folder)
+
+def stored_file(folder, section):
+    return get_section_address(folder, section, section_codec(read_manifest(folder), section))
+
+def test_reuse_unchanged_sections(tmp_path):
+    first = make_save(tmp_path / "campaign", "save_1850", "1850.1.1.1", 100)
+    second = make_save(tmp_path / "campaign", "save_1851", "1851.1.1.1", 200) # Only its pops and date changed
+    expected = ExtractorSave(f"{second}/save.txt").data
+    extract_save_file(first)
+    assert read_manifest(first)["reused"] == []
+    extract_save_file(second)
+    assert sorted(read_manifest(second)["reused"]) == ["pacts", "states"]
+    for section in ["pacts", "states"]: # Linked rather than parsed again
+        assert os.path.samefile(stored_file(first, section), stored_file(second, section))
+    assert not os.path.samefile(stored_file(first, "pops"), stored_file(second, "pops"))
+    assert load_save(list(expected), second) == expected
+    assert load_save(["pops"], first)["pops"]["database"]["1"]["workforce"] == "100"
+
+def test_reuse_closest_save(tmp_path):
+    saves = [make_save(tmp_path / "campaign", f"save_{year}", f"{year}.1.1.1", year) for year in [1850, 1853, 1852]]
+    for save in saves[:2]:
+        extract_save_file(save)
+    extract_save_file(saves[2]) # Closer to save_1853 in game date, only compared with it
+    assert sorted(read_manifest(saves[2])["reused"]) == ["pacts", "states"]
+    assert os.path.samefile(stored_file(saves[1], "states"), stored_file(saves[2], "states"))
+    assert load_save(["pops"], saves[2])["pops"]["database"]["1"]["workforce"] == "1852"
+
+def test_single_save_not_hashed(tmp_path):
+    save = make_save(tmp_path / "campaign", "save_1850", "1850.1.1.1", 100)
+    extract_save_file(save)
+    manifest = read_manifest(save)
+    assert "hashes" not in manifest and "reused" not in manifest
+    assert not os.path.exists(get_index_address(f"{save}/save.txt")) # Nor indexed
+    assert load_save(["pops"], save)["pops"]["database"]["1"]["workforce"] == "100"
@@ -0,0 +1,59 @@
+"""
+Checking the data of a save extracted with typed values (see ExtractorSave), whose ids are int
+"""
+import json
+from src.extractor import ExtractorSave
+from src.checkers.manager import SaveManager
+from src.checkers.check_infamy import CheckInfamy
+
+SAVE = """meta_data={
+    version="1.10"
+    game_date=1850.3.14.6
+}
+player_manager={
+    database={
+        0={ country=5 }
+        1={ country=7 }
+        2={ country=5 }
+        3={ country=12 }
+    }
+}
+country_manager={
+    database={
+        5={ definition="GBR" infamy=12.5 }
+        7={ definition="FRA" civil_war=yes }
+        9={ definition="PRU" }
+        12=none
+    }
+}
+"""
+
+def extract(tmp_path, typed, name="save"):
+    folder = tmp_path / name
+    folder.mkdir()
+    ExtractorSave(SAVE.encode(), typed=typed).write(str(folder), separate=True)
+    return str(folder)
+
+def test_metadata_typed(tmp_path):
+    folder = extract(tmp_path, typed=True)
+    save = SaveManager(folder, [], localization={"GBR": "Great Britain"})
+    assert save.metadata["save_date"] == ["1850", "3", "14"]
+    assert save.metadata["players"] == [[5, "GBR", "Great Britain"], [7, "FRA", "Revolutionary FRA"]]
+    with open(f"{folder}/metadata.json") as file:
+        assert json.load(file) == save.metadata
+
+def test_metadata_typed_matches_strings(tmp_path):
+    typed = SaveManager(extract(tmp_path, typed=True, name="typed"), [], localization={})
+    strings = SaveManager(extract(tmp_path, typed=False, name="strings"), [], localization={})
+    assert typed.metadata == strings.metadata
+
+def test_check_typed(tmp_path):
+    folder = extract(tmp_path, typed=True)
+    save = SaveManager(folder, [CheckInfamy()], localization={})
+    save.start_checking()
+    with open(f"{folder}/data/infamy.csv") as file:
+        rows = [line.strip().split(",") for line in file]
+    assert rows[0] == ["id", "tag", "country", "infamy"]
+    assert rows[1] == ["5", "GBR", "GBR", "12.5"]
+    with open(f"{folder}/infamy.csv") as file:
+        assert [line.split(",")[0] for line in file][1:] == ["5", "7"] # Players only
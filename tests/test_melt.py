@@ -0,0 +1,112 @@
+"""
+Freeing librakaly's buffers in melt_buffer, with librakaly replaced by a fake recording the calls
+"""
+import subprocess, threading, platform, sys
+import pytest
+from src.helpers import melt
+
+class FakeRakaly:
+    """Melts every save into MELTED, or fails at the step named by fail"""
+    MELTED = b"meta_data={ }\n"
+
+    def __init__(self, fail=None):
+        self.fail = fail
+        self.freed = []
+
+    def rakaly_vic3_file(self, data, length):
+        return "file_result"
+    def rakaly_file_error(self, result):
+        return "file_error" if self.fail == "file" else None
+    def rakaly_file_value(self, result):
+        return "file"
+    def rakaly_file_melt(self, save):
+        return "melt_result"
+    def rakaly_melt_error(self, result):
+        return "melt_error" if self.fail == "melt" else None
+    def rakaly_melt_value(self, result):
+        return "melt"
+    def rakaly_melt_binary_unknown_tokens(self, melted):
+        return False
+    def rakaly_melt_is_verbatim(self, melted):
+        return False
+    def rakaly_melt_data_length(self, melted):
+        return len(self.MELTED)
+    def rakaly_melt_write_data(self, melted, buffer, length):
+        if self.fail == "write":
+            return 0
+        buffer[:length] = self.MELTED
+        return length
+    def rakaly_error_length(self, error):
+        return 5
+    def rakaly_error_write_data(self, error, message, length):
+        message.value = b"error"
+        return length
+    def rakaly_free_file(self, save):
+        self.freed.append(save)
+    def rakaly_free_melt(self, melted):
+        self.freed.append(melted)
+    def rakaly_free_error(self, error):
+        self.freed.append(error)
+
+@pytest.fixture
+def save(tmp_path):
+    address = tmp_path / "save.v3"
+    address.write_bytes(b"SAV0102")
+    return str(address)
+
+def use(monkeypatch, fake):
+    monkeypatch.setattr(melt, "rakaly", fake)
+    monkeypatch.setattr(melt, "load_rakaly", lambda: fake)
+
+def test_melt_buffer(monkeypatch, save):
+    fake = FakeRakaly()
+    use(monkeypatch, fake)
+    assert melt.melt_buffer(save) == FakeRakaly.MELTED
+    assert fake.freed == ["file", "melt"]
+
+@pytest.mark.parametrize("fail, freed", [("file", ["file_error"]), ("melt", ["melt_error", "file"]), ("write", ["file", "melt"])])
+def test_melt_buffer_failure_frees(monkeypatch, save, fail, freed):
+    fake = FakeRakaly(fail)
+    use(monkeypatch, fake)
+    with pytest.raises(ValueError):
+        melt.melt_buffer(save)
+    assert fake.freed == freed
+
+MELTER = """import sys
+sys.stderr.write("Unknown token\\n" * 100000)
+sys.stderr.flush()
+sys.stdout.write("meta_data={ }\\n" * 100000)
+sys.exit(int(sys.argv[1]))
+"""
+
+def fake_melter(monkeypatch, returncode):
+    """Start a script writing more warnings than a pipe holds before its output in place of the melter executable"""
+    popen = subprocess.Popen
+    monkeypatch.setattr(subprocess, "Popen", lambda command, **kwargs: popen([sys.executable, "-c", MELTER, str(returncode)], **kwargs))
+
+def read_melter(returncode):
+    process = melt.melt("save.v3", stream=True)
+    output = []
+    reader = threading.Thread(target=lambda: output.append(process.stdout.read()), daemon=True)
+    reader.start()
+    reader.join(30)
+    if reader.is_alive():
+        process.kill()
+        pytest.fail("The melter blocked on its warnings")
+    return process, output[0]
+
+@pytest.mark.skipif(platform.system() != "Linux", reason="Streaming the melter output is only available on Linux")
+def test_melt_stream_warnings(monkeypatch):
+    fake_melter(monkeypatch, 0)
+    process, output = read_melter(0)
+    assert output == b"meta_data={ }\n" * 100000
+    melt.finish_melt(process, "save.v3")
+    assert process.errors.closed
+
+@pytest.mark.skipif(platform.system() != "Linux", reason="Streaming the melter output is only available on Linux")
+def test_melt_stream_failure(monkeypatch, capsys):
+    fake_melter(monkeypatch, 1)
+    process, _ = read_melter(1)
+    with pytest.raises(ValueError):
+        melt.finish_melt(process, "save.v3")
+    assert "Unknown token" in capsys.readouterr().out
@@ -0,0 +1,142 @@
+"""
+Storage of the extracted sections of a save (see src/helpers/storage.py) and reading them back with load_save
+"""
+import gzip, os, pickle, shutil
+import pytest
+from src.helpers.storage import CODECS, write_sections, read_sections, read_manifest, get_section_address, iter_shards
+from src.helpers.utility import load_save
+
+SECTIONS = {
+    "meta_data": {"meta_data": {"version": "1.9", "game_date": "1850.3.14.6"}},
+    "pops": {"pops": {"database": {str(i): {"type": "laborers", "workforce": str(100 * i)} for i in range(10)}}},
+}
+
+@pytest.fixture
+def save(tmp_path):
+    folder = tmp_path / "save"
+    (folder / "extracted_save").mkdir(parents=True)
+    return str(folder)
+
+@pytest.mark.parametrize("codec", list(CODECS) + ["zlib-1", "lzma-0", "gzip-9"])
+def test_codec_round_trip(save, codec):
+    write_sections(save, SECTIONS, codec)
+    manifest = read_manifest(save)
+    assert manifest["codecs"] == {"meta_data": codec, "pops": codec}
+    assert os.path.exists(get_section_address(save, "pops", codec))
+    assert read_sections(save, SECTIONS, manifest) == SECTIONS
+    assert load_save(["meta_data", "pops"], save) == {section: data[section] for section, data in SECTIONS.items()}
+
+def test_codec_change(save):
+    write_sections(save, SECTIONS, "zlib-1")
+    write_sections(save, {"pops": SECTIONS["pops"]}, "lzma")
+    assert sorted(os.listdir(f"{save}/extracted_save")) == ["manifest.json", "meta_data.zlib", "pops.xz"]
+    assert read_manifest(save)["codecs"] == {"meta_data": "zlib-1", "pops": "lzma"}
+    assert read_sections(save, SECTIONS) == SECTIONS
+
+def test_unknown_codec(save):
+    with pytest.raises(ValueError):
+        write_sections(save, SECTIONS, "zstd")
+
+def write_legacy(save, large, miscellaneous):
+    """Store sections like saves extracted before the manifest: gzip pickles, the small sections together in miscellaneous.gz"""
+    for topic, data in large.items():
+        with gzip.open(f"{save}/extracted_save/{topic}.gz", "wb") as file:
+            pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+    with gzip.open(f"{save}/extracted_save/miscellaneous.gz", "wb") as file:
+        pickle.dump(miscellaneous, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_legacy_save(save, lazy):
+    write_legacy(save, {"pops": SECTIONS["pops"]}, SECTIONS["meta_data"])
+    assert read_manifest(save) == dict()
+    data = load_save(["meta_data", "pops"], save, lazy=lazy)
+    assert data["pops"] == SECTIONS["pops"]["pops"]
+    assert data["meta_data"] == SECTIONS["meta_data"]["meta_data"]
+
+def test_miscellaneous_fallback(save):
+    write_legacy(save, dict(), {"meta_data": SECTIONS["meta_data"]["meta_data"], "pacts": {"database": dict()}})
+    write_sections(save, {"pops": SECTIONS["pops"]}, "zlib-1") # Sections extracted again later are stored on their own
+    data = load_save(["pops", "pacts", "meta_data"], save)
+    assert data == {"pops": SECTIONS["pops"]["pops"], "pacts": {"database": dict()}, "meta_data": SECTIONS["meta_data"]["meta_data"]}
+    with pytest.raises(FileNotFoundError):
+        load_save(["states"], save)
+
+def database(keys):
+    return {"pops": {"database": {str(key): {"workforce": str(key)} for key in keys}, "next_id": str(max(keys, default=0) + 1)}}
+
+def write_sharded(save, data, shard_size=2):
+    write_sections(save, {"pops": data}, "zlib-1", sharded=["pops"], shard_size=shard_size)
+
+def test_sharded_round_trip(save):
+    data = database([5, 1, 3, 7, 2])
+    write_sharded(save, data)
+    assert read_manifest(save)["shards"] == {"pops": 3}
+    assert sorted(os.listdir(f"{save}/extracted_save")) == ["manifest.json", "pops.0.zlib", "pops.1.zlib", "pops.2.zlib", "pops.zlib"]
+    loaded = read_sections(save, ["pops"])["pops"]
+    assert loaded == data
+    assert list(loaded["pops"]["database"]) == ["5", "1", "3", "7", "2"] # In the order of the save
+    assert [list(shard) for shard in iter_shards(save, "pops")] == [["5", "1"], ["3", "7"], ["2"]]
+    assert load_save(["pops"], save) == {"pops": data["pops"]}
+
+def test_sharded_shrink(save):
+    write_sharded(save, database(range(5)))
+    data = database([0, 4, 9])
+    write_sharded(save, data)
+    assert read_manifest(save)["shards"] == {"pops": 2}
+    assert not os.path.exists(get_section_address(save, "pops.2", "zlib-1")) # Stale shard
+    assert read_sections(save, ["pops"])["pops"] == data
+
+def test_sharded_empty(save):
+    write_sharded(save, database(range(3)))
+    data = database([])
+    write_sharded(save, data)
+    assert read_manifest(save)["shards"] == {"pops": 1}
+    assert not os.path.exists(get_section_address(save, "pops.1", "zlib-1"))
+    assert read_sections(save, ["pops"])["pops"] == data
+    assert list(iter_shards(save, "pops")) == [dict()]
+
+def test_unsharded_again(save):
+    write_sharded(save, database(range(5)))
+    data = database(range(5))
+    write_sections(save, {"pops": data}, "zlib-1")
+    assert read_manifest(save)["shards"] == dict()
+    assert sorted(os.listdir(f"{save}/extracted_save")) == ["manifest.json", "pops.zlib"]
+    assert read_sections(save, ["pops"])["pops"] == data
+
+def campaign_save(tmp_path, name):
+    folder = tmp_path / "campaign" / name
+    (folder / "extracted_save").mkdir(parents=True)
+    return str(folder)
+
+def blobs(tmp_path):
+    return sorted(name for _, _, names in os.walk(tmp_path / "campaign" / "campaign_data" / "blobs") for name in names)
+
+def write_deduplicated(save, data):
+    write_sections(save, {"pops": data}, "zlib-1", sharded=["pops"], shard_size=2, deduplicated=["pops"], block_size=2)
+
+def test_deduplicated_saves(tmp_path):
+    first, second = campaign_save(tmp_path, "save_1850"), campaign_save(tmp_path, "save_1851")
+    data = database([1, 0, 2, 3, 5])
+    write_deduplicated(first, data)
+    assert read_manifest(first)["deduplicated"] == ["pops"]
+    assert read_manifest(first)["shards"] == dict() # Deduplication takes precedence
+    assert len(shared := blobs(tmp_path)) == 3 # Blocks of keys 0-1, 2-3 and 4-5
+    write_deduplicated(second, data)
+    assert blobs(tmp_path) == shared
+    loaded = read_sections(second, ["pops"])["pops"]
+    assert loaded == data
+    assert list(loaded["pops"]["database"]) == ["1", "0", "2", "3", "5"] # In the order of the save
+    shutil.rmtree(first)
+    assert read_sections(second, ["pops"])["pops"] == data
+    assert load_save(["pops"], second, lazy=True)["pops"] == data["pops"]
+
+def test_deduplicated_changed_block(tmp_path):
+    first, second = campaign_save(tmp_path, "save_1850"), campaign_save(tmp_path, "save_1851")
+    write_deduplicated(first, database(range(6)))
+    shared = blobs(tmp_path)
+    data = database(range(6))
+    data["pops"]["database"]["3"]["workforce"] = "300"
+    write_deduplicated(second, data)
+    assert len(set(blobs(tmp_path)) - set(shared)) == 1 # Only the block of keys 2-3 changed
+    shutil.rmtree(first)
+    assert read_sections(second, ["pops"])["pops"] == data